@@ -46,34 +46,31 @@ def check_unsupported_environment():
 
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 # Важно: импортируем наш новый модуль и вызываем инициализацию
 from utils import database
+from utils.fsm_storage import create_storage
+from utils.texts import texts
+from utils.outbound import OutboundSession, outbound_scheduler
 
-from config_loader import BOT_TOKEN, OWNER_ID, PAYMENT
+from config_loader import BOT_TOKEN, OWNER_ID, PAYMENT, THROTTLING
 from handlers import user_handlers, admin_handlers, management_handlers
 from middlewares.block_middleware import BlockMiddleware
+from middlewares.throttling_middleware import ThrottlingMiddleware
+from services.ssh_pool import ssh_pool
+from services.status_reconciler import run_status_reconciler
+from services import container_events as events
+from services.allocator import sync_host_ports
+from services.provisioning import provisioning_queue
+from services.warm_pool import run_warm_pool
+from services.image_manager import run_image_manager
+from services.metering import run_metering
+from services.billing import run_billing
+from utils import webhook, workers
 
 logging.basicConfig(level=logging.INFO)
 
-async def main():
-    # --- Вызываем проверку перед запуском основной логики ---
-    check_unsupported_environment()
-    
-    # --- ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ ---
-    database.init_db()
-    
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-
-    dp.update.outer_middleware(BlockMiddleware())
-
-    dp.include_router(admin_handlers.router)
-    dp.include_router(user_handlers.router)
-    dp.include_router(management_handlers.router)
-
+async def warn_missing_payment(bot: Bot):
     if not PAYMENT.get("sbp_phone") and not PAYMENT.get("card_number"):
         try:
             await bot.send_message(
@@ -84,11 +81,100 @@ async def main():
         except Exception as e:
             logging.warning(f"Не удалось отправить предупреждение владельцу: {e}")
 
+def create_bot() -> Bot:
+    # Все запросы к Telegram идут через планировщик, соблюдающий лимиты на отправку сообщений
+    return Bot(token=BOT_TOKEN, session=OutboundSession(outbound_scheduler))
+
+def create_dispatcher() -> Dispatcher:
+    # Состояния диалогов хранятся в SQLite и переживают перезапуск
+    storage = create_storage()
+    dp = Dispatcher(storage=storage)
+
+    dp.update.outer_middleware(BlockMiddleware())
+    # После BlockMiddleware: заблокированные отсекаются раньше, а роль пользователя уже известна
+    dp.update.outer_middleware(ThrottlingMiddleware(**THROTTLING))
+
+    dp.include_router(admin_handlers.router)
+    dp.include_router(user_handlers.router)
+    dp.include_router(management_handlers.router)
+    return dp
+
+async def start_background_tasks(bot: Bot) -> list[asyncio.Task]:
+    """Запускает фоновые задачи. В режиме нескольких процессов их выполняет только процесс-лидер."""
+    # Статусы контейнеров: поток событий Docker, а если он отключён - периодический опрос серверов
+    if events.ENABLED:
+        reconciler_task = asyncio.create_task(events.container_events.run(bot))
+    else:
+        reconciler_task = asyncio.create_task(run_status_reconciler())
+    # Сверка выдаваемых портов с реально занятыми на серверах
+    ports_sync_task = asyncio.create_task(sync_host_ports())
+    # Загрузка образа на все серверы и закрепление его digest
+    image_task = asyncio.create_task(run_image_manager())
+    # Воркеры очереди создания/удаления контейнеров (продолжают задачи, прерванные перезапуском)
+    await provisioning_queue.start(bot)
+    # Пополнение пула заготовок контейнеров для мгновенной выдачи
+    warm_pool_task = asyncio.create_task(run_warm_pool())
+    # Сбор метрик потребления CPU/RAM контейнерами
+    metering_task = asyncio.create_task(run_metering())
+    # Периодическое списание оплаты за контейнеры
+    billing_task = asyncio.create_task(run_billing(bot))
+    return [reconciler_task, ports_sync_task, image_task, warm_pool_task, metering_task, billing_task]
+
+async def stop_background_tasks(tasks: list[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await provisioning_queue.stop()
+
+async def main():
+    # --- Вызываем проверку перед запуском основной логики ---
+    check_unsupported_environment()
+    
+    # --- ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ ---
+    await database.init_db()
+    # Опечатки в texts.json (неизвестные ключи, лишние плейсхолдеры) видны в логе сразу, а не пользователям
+    texts.validate()
+
+    if workers.ENABLED:
+        # Миграции уже применены, дальше с БД работают только процессы-воркеры
+        await database.close_db()
+        await workers.run_supervisor(worker_process, create_dispatcher().resolve_used_update_types())
+        return
+    
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    await warn_missing_payment(bot)
+    tasks = await start_background_tasks(bot)
+    try:
+        if webhook.ENABLED:
+            await webhook.run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await stop_background_tasks(tasks)
+        await ssh_pool.close_all()
+        await database.close_db()
+        await bot.session.close()
+
+async def worker_main(index: int, updates):
+    """Процесс-воркер: обрабатывает обновления своей доли пользователей, фоновые задачи - только если стал лидером."""
+    bot = create_bot()
+    dp = create_dispatcher()
+    if index == 0:
+        await warn_missing_payment(bot)
     try:
-        await dp.start_polling(bot)
+        await workers.run_worker(index, updates, bot, dp, start_background_tasks, stop_background_tasks)
     finally:
+        await ssh_pool.close_all()
+        await database.close_db()
         await bot.session.close()
 
+def worker_process(index: int, updates):
+    """Точка входа процесса-воркера (запускается супервизором через multiprocessing)."""
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s:%(name)s:%(message)s", force=True)
+    asyncio.run(worker_main(index, updates))
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
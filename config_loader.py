@@ -8,9 +8,42 @@ OWNER_ID = config.owner_id
 # --- Настройки хостинга ---
 DOCKER_IMAGE = config.docker_image
 SERVERS = config.servers
+# Способ работы с Docker на серверах: "cli" (команды docker по SSH) или "api" (Docker Engine API через сокет)
+DOCKER_BACKEND = getattr(config, "docker_backend", "cli")
+# Настройки пула SSH-соединений (необязательные, для старых config.py берутся значения по умолчанию)
+SSH_POOL = getattr(config, "ssh_pool", {})
+# Как часто фоновая задача опрашивает серверы и через сколько секунд кэшированный статус считается устаревшим
+STATUS_POLL_INTERVAL = getattr(config, "status_poll_interval", 60)
+STATUS_STALE_AFTER = getattr(config, "status_stale_after", 180)
+# Поток событий Docker вместо периодического опроса статусов
+CONTAINER_EVENTS = getattr(config, "container_events", {})
+# Выбор сервера для нового контейнера
+PLACEMENT = getattr(config, "placement", {})
+# Очередь создания/удаления контейнеров
+PROVISIONING = getattr(config, "provisioning", {})
+# Пул заранее созданных контейнеров для мгновенной выдачи при покупке
+WARM_POOL = getattr(config, "warm_pool", {})
+# Фоновая загрузка образа на серверы
+IMAGE_SYNC = getattr(config, "image_sync", {})
+# Сбор метрик потребления ресурсов контейнерами
+METERING = getattr(config, "metering", {})
+# Хранилище состояний FSM в SQLite
+FSM_STORAGE = getattr(config, "fsm_storage", {})
+# Настройки кэша пользователей в памяти процесса
+USER_CACHE = getattr(config, "user_cache", {})
+# Ограничение частоты запросов пользователей
+THROTTLING = getattr(config, "throttling", {})
+# Лимиты исходящих сообщений в Telegram
+OUTBOUND = getattr(config, "outbound", {})
+# Приём обновлений через вебхук вместо long polling
+WEBHOOK = getattr(config, "webhook", {})
+# Режим нескольких процессов-воркеров
+WORKERS = getattr(config, "workers", {})
 
 # --- Финансы ---
 PAYMENT = config.payment
+# Периодическая оплата контейнеров (по умолчанию выключена - покупка разовая, как раньше)
+BILLING = getattr(config, "billing", {})
 
 # --- Внешний вид ---
 BANNER_LOCAL_PATH = config.banner_local_path
\ No newline at end of file
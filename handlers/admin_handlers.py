@@ -5,19 +5,22 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 import asyncio
 import contextlib
+import logging
 
 from config_loader import SERVERS
 from keyboards import inline
 from states import AdminStates
 from utils import database as db
-from services import docker_manager
+from services import status_reconciler, image_manager, placement, billing
 from utils.texts import texts
 from utils.message_utils import send_or_edit_message_with_banner
+from utils.outbound import outbound_scheduler
 
 # --- ФИЛЬТР ДЛЯ ПРОВЕРКИ РОЛИ АДМИНИСТРАТОРА ---
 class AdminFilter(BaseFilter):
-    async def __call__(self, event: Message | CallbackQuery) -> bool:
-        user = db.get_or_create_user(event.from_user.id)
+    async def __call__(self, event: Message | CallbackQuery, db_user: dict | None = None) -> bool:
+        # Запись пользователя уже загружена BlockMiddleware
+        user = db_user or await db.get_or_create_user(event.from_user.id)
         return user.get('role') == 'admin'
 
 router = Router()
@@ -47,20 +50,22 @@ async def admin_panel_callback(query: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("admin_users"))
 async def admin_show_users(query: CallbackQuery):
     page = int(query.data.split("_")[-1]) if query.data.startswith("admin_users_page") else 0
-    all_users = db.get_all_users_info()
-    if not all_users:
+    # Из БД читаем только текущую страницу и общее количество
+    total = await db.count_users()
+    if not total:
         await query.answer(texts.get("admin.no_users"), show_alert=True)
         return
+    users_page = await db.get_users_page(inline.PER_PAGE, page * inline.PER_PAGE)
     await send_or_edit_message_with_banner(
         event=query,
         text=texts.get("admin.users_list_title", page=page+1),
-        reply_markup=inline.admin_users_list_keyboard(all_users, page)
+        reply_markup=inline.admin_users_list_keyboard(users_page, page, total)
     )
 
 @router.callback_query(F.data.startswith("admin_user_manage_"))
 async def admin_manage_user(query: CallbackQuery):
     user_id = int(query.data.split("_")[-1])
-    user_data = db.get_or_create_user(user_id)
+    user_data = await db.get_or_create_user(user_id)
     text = texts.get("admin.user_manage_title",
                      user_id=user_id, balance=user_data['balance'],
                      is_blocked='Да' if user_data.get('is_blocked') else 'Нет')
@@ -73,9 +78,9 @@ async def admin_manage_user(query: CallbackQuery):
 @router.callback_query(F.data.startswith("admin_user_block_"))
 async def admin_block_user(query: CallbackQuery):
     user_id = int(query.data.split("_")[-1])
-    user_data = db.get_or_create_user(user_id)
+    user_data = await db.get_or_create_user(user_id)
     new_status = not user_data.get('is_blocked', False)
-    db.set_user_blocked_status(user_id, new_status)
+    await db.set_user_blocked_status(user_id, new_status)
     status_text = 'заблокирован' if new_status else 'разблокирован'
     await query.answer(texts.get("admin.user_block_status_changed", status=status_text), show_alert=True)
     await admin_manage_user(query)
@@ -98,7 +103,7 @@ async def admin_change_balance_amount(message: Message, state: FSMContext, bot:
         return
     data = await state.get_data()
     user_id = data.get("target_user_id")
-    db.set_user_balance(user_id, amount)
+    await db.set_user_balance(user_id, amount)
     await state.clear()
     
     # После ввода данных возвращаем меню с баннером
@@ -110,39 +115,114 @@ async def admin_change_balance_amount(message: Message, state: FSMContext, bot:
         await bot.send_message(user_id, texts.get("admin.balance_update_notification", amount=amount))
     except Exception as e:
         print(f"Не удалось уведомить {user_id}: {e}")
+    await billing.resume_user(bot, user_id)
 
 # --- УПРАВЛЕНИЕ КОНТЕЙНЕРАМИ ---
 
 @router.callback_query(F.data.startswith("admin_containers"))
 async def admin_show_containers(query: CallbackQuery):
     page = int(query.data.split("_")[-1]) if query.data.startswith("admin_containers_page") else 0
-    all_containers = db.get_all_containers_info()
-    if not all_containers:
+    total = await db.count_containers()
+    if not total:
         await query.answer(texts.get("admin.no_containers"), show_alert=True)
         return
+    page_containers = await db.get_containers_page(inline.PER_PAGE, page * inline.PER_PAGE)
+    # Устаревшие статусы обновляем только для контейнеров текущей страницы, одним вызовом на сервер
+    await status_reconciler.refresh_statuses(page_containers)
     await send_or_edit_message_with_banner(
         event=query,
         text=texts.get("admin.containers_list_title", page=page+1),
-        reply_markup=inline.admin_containers_list_keyboard(all_containers, page)
+        reply_markup=inline.admin_containers_list_keyboard(page_containers, page, total)
     )
 
 @router.callback_query(F.data.startswith("admin_manage_container_"))
 async def admin_manage_container(query: CallbackQuery):
     container_db_id = int(query.data.split("_")[-1])
-    container = db.get_container_by_db_id(container_db_id)
+    container = await db.get_container_by_db_id(container_db_id)
     if not container:
         await query.answer(texts.get("management.container_not_found"), show_alert=True)
         return
-    server = SERVERS[container['server_index']]
-    status = await docker_manager.get_container_status(container, server)
+    await status_reconciler.refresh_statuses([container])
     text = texts.get("admin.container_manage_title", container_name=container['name'],
-                     user_id=container['user_id'], status=status)
+                     user_id=container['user_id'], status=container['status'],
+                     updated=status_reconciler.format_status_age(container))
     await send_or_edit_message_with_banner(
         event=query,
         text=text,
         reply_markup=inline.management_keyboard(container, container['id'])
     )
 
+# --- ОБРАЗ НА СЕРВЕРАХ ---
+
+async def _render_images(query: CallbackQuery):
+    reference, report = await image_manager.get_images_report()
+    lines = []
+    for server in report:
+        if server['digest'] is None:
+            lines.append(texts.get("admin.image_server_missing", ip=server['ip']))
+            continue
+        age = status_reconciler.format_status_age({'status_updated_at': server['pulled_at']})
+        lines.append(texts.get("admin.image_server_drift" if server['drift'] else "admin.image_server_ok",
+                               ip=server['ip'], digest=server['digest'][-19:], updated=age))
+    await send_or_edit_message_with_banner(
+        event=query,
+        text=texts.get("admin.images_title", reference=reference[-19:] if reference else "—",
+                       servers="\n".join(lines)),
+        reply_markup=inline.admin_images_keyboard()
+    )
+
+@router.callback_query(F.data == "admin_images")
+async def admin_show_images(query: CallbackQuery):
+    await _render_images(query)
+
+# Скачивание образа на все серверы может идти минутами, поэтому выполняется в фоне
+_pull_task: asyncio.Task | None = None
+
+async def _pull_and_render(query: CallbackQuery):
+    try:
+        await image_manager.pull_all()
+        await _render_images(query)
+    except Exception as e:
+        logging.error(f"Не удалось обновить образ на серверах: {e}")
+
+@router.callback_query(F.data == "admin_images_pull")
+async def admin_pull_images(query: CallbackQuery):
+    global _pull_task
+    if _pull_task is not None and not _pull_task.done():
+        await query.answer(texts.get("errors.already_processing"))
+        return
+    await query.answer(texts.get("admin.images_pulling"))
+    # Хендлер не ждёт скачивания: очередь обновлений администратора не блокируется,
+    # а экран образов обновится, когда скачивание закончится
+    _pull_task = asyncio.create_task(_pull_and_render(query))
+
+# --- НАГРУЗКА СЕРВЕРОВ ---
+
+@router.callback_query(F.data == "admin_usage")
+async def admin_show_usage(query: CallbackQuery):
+    usage = await db.get_servers_usage()
+    capacities = await asyncio.gather(*(placement.get_capacity(index) for index in range(len(SERVERS))))
+    lines = []
+    for index, server in enumerate(SERVERS):
+        server_usage = usage.get(index)
+        if server_usage is None:
+            lines.append(texts.get("admin.usage_server_missing", ip=server['ip']))
+            continue
+        capacity = capacities[index] or {}
+        lines.append(texts.get(
+            "admin.usage_server", ip=server['ip'], containers=server_usage['containers'],
+            cpu=f"{server_usage['cpu'] / 100:.1f}", cpu_total=capacity.get("cpu", "?"),
+            memory=round(server_usage['memory_mb']), memory_total=capacity.get("memory_mb", "?"),
+            updated=status_reconciler.format_status_age({'status_updated_at': server_usage['ts']})
+        ))
+    outbound_stats = outbound_scheduler.stats()
+    lines.append(texts.get("admin.usage_outbound", **outbound_stats))
+    await send_or_edit_message_with_banner(
+        event=query,
+        text=texts.get("admin.usage_title", servers="\n".join(lines)),
+        reply_markup=inline.back_to_admin_panel()
+    )
+
 # --- НАСТРОЙКИ БОТА (ТАРИФЫ) ---
 
 @router.callback_query(F.data == "admin_settings")
@@ -152,13 +232,13 @@ async def admin_settings(query: CallbackQuery):
 @router.callback_query(F.data == "admin_tariffs")
 async def admin_manage_tariffs(query: CallbackQuery, state: FSMContext):
     await state.clear()
-    tariffs = db.get_tariffs()
+    tariffs = await db.get_tariffs()
     await send_or_edit_message_with_banner(query, texts.get("admin.tariffs_menu"), inline.admin_tariffs_keyboard(tariffs))
 
 @router.callback_query(F.data.startswith("admin_delete_tariff_"))
 async def admin_delete_tariff(query: CallbackQuery, state: FSMContext):
     tariff_id = int(query.data.split("_")[-1])
-    db.delete_tariff_by_id(tariff_id)
+    await db.delete_tariff_by_id(tariff_id)
     await query.answer(texts.get("admin.tariff_deleted"), show_alert=True)
     await admin_manage_tariffs(query, state)
 
@@ -219,7 +299,7 @@ async def admin_add_tariff_memory(message: Message, state: FSMContext):
         return
     await state.update_data(memory_limit=memory_limit)
     data = await state.get_data()
-    db.add_tariff(data)
+    await db.add_tariff(data)
     await state.clear()
     await send_or_edit_message_with_banner(
         event=message,
@@ -227,24 +307,53 @@ async def admin_add_tariff_memory(message: Message, state: FSMContext):
         reply_markup=inline.back_to_admin_panel()
     )
 
-# --- ОБРАБОТЧИКИ ПОДТВЕРЖДЕНИЯ ОПЛАТЫ (Остаются без изменений) ---
+# --- ОБРАБОТЧИКИ ПОДТВЕРЖДЕНИЯ ОПЛАТЫ ---
+
+async def _decide_payment(query: CallbackQuery, approve: bool):
+    """
+    Проводит решение по заявке ровно один раз. Возвращает (user_id, amount, принято ли решение этим нажатием)
+    или None, если заявка не найдена.
+    """
+    parts = query.data.split("_")
+    if len(parts) == 2:
+        request, changed = await db.decide_payment_request(int(parts[1]), approve)
+        if request is None:
+            return None
+        return request['user_id'], request['amount'], changed
+
+    # Кнопки заявок, отправленных до появления payment_requests: approve_{user_id}_{amount}.
+    # Ключ привязан к сообщению заявки; отклонение записывает нулевую операцию с тем же ключом
+    user_id, amount = int(parts[1]), int(parts[2])
+    key = f"payment:legacy:{query.message.chat.id}:{query.message.message_id}"
+    if approve:
+        changed = await db.add_transaction(user_id, amount, "payment", key)
+    else:
+        changed = await db.add_transaction(user_id, 0, "payment_declined", key)
+    return user_id, amount, changed
 
 @router.callback_query(F.data.startswith("approve_"))
 async def approve_payment_handler(query: CallbackQuery, bot: Bot):
-    _, user_id_str, amount_str = query.data.split("_")
-    user_id, amount = int(user_id_str), int(amount_str)
-    db.get_or_create_user(user_id)
-    db.update_user_balance(user_id, amount)
-    new_balance = db.get_or_create_user(user_id)['balance']
+    decision = await _decide_payment(query, approve=True)
+    if decision is None or not decision[2]:
+        await query.message.edit_reply_markup(reply_markup=None)
+        await query.answer(texts.get("admin.payment_already_processed"), show_alert=True)
+        return
+    user_id, amount, _ = decision
+    new_balance = (await db.get_or_create_user(user_id))['balance']
     await bot.send_message(user_id, texts.get("admin.payment_approved_notification",
                                                amount=amount, new_balance=new_balance))
     await query.message.edit_caption(caption=query.message.caption + texts.get("admin.payment_approved_log"), reply_markup=None)
     await query.answer(texts.get("admin.payment_approved_log").strip())
+    await billing.resume_user(bot, user_id)
 
 @router.callback_query(F.data.startswith("decline_"))
 async def decline_payment_handler(query: CallbackQuery, bot: Bot):
-    _, user_id_str, amount_str = query.data.split("_")
-    user_id, amount = int(user_id_str), int(amount_str)
+    decision = await _decide_payment(query, approve=False)
+    if decision is None or not decision[2]:
+        await query.message.edit_reply_markup(reply_markup=None)
+        await query.answer(texts.get("admin.payment_already_processed"), show_alert=True)
+        return
+    user_id, amount, _ = decision
     await bot.send_message(user_id, texts.get("admin.payment_declined_notification", amount=amount))
     await query.message.edit_caption(caption=query.message.caption + texts.get("admin.payment_declined_log"), reply_markup=None)
-    await query.answer(texts.get("admin.payment_declined_log").strip())
\ No newline at end of file
+    await query.answer(texts.get("admin.payment_declined_log").strip())
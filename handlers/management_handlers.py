@@ -4,8 +4,10 @@ from aiogram.types import CallbackQuery
 
 from keyboards.inline import management_keyboard, confirm_action_keyboard, my_userbots_keyboard
 from services import docker_manager
+from services.provisioning import provisioning_queue
 from utils import database as db
-from config_loader import SERVERS
+from config_loader import SERVERS, STATUS_STALE_AFTER
+from services import status_reconciler, metering, billing
 from utils.texts import texts # <-- НОВЫЙ ИМПОРТ
 
 router = Router()
@@ -19,28 +21,36 @@ async def manage_container_handler(query: CallbackQuery):
         return
 
     user_id = query.from_user.id
-    container = db.get_container_by_db_id(container_db_id)
+    container = await db.get_container_by_db_id(container_db_id)
 
     if not container or container['user_id'] != user_id:
         await query.answer(texts.get("management.container_not_found"), show_alert=True)
-        user_containers = db.get_user_containers(user_id)
+        user_containers = await db.get_user_containers(user_id)
         await query.message.edit_text(
             texts.get("main_menu.my_userbots_title"), parse_mode="HTML",
             reply_markup=my_userbots_keyboard(user_containers)
         )
         return
 
-    server = SERVERS[container['server_index']]
-    
-    await query.message.edit_text(texts.get("management.status_check"))
-    
-    status = await docker_manager.get_container_status(container, server)
-    if status != 'error':
-        db.update_container_status(container_db_id, status)
-        container['status'] = status
+    # Статус берём из кэша в БД; живой запрос к серверу - только если кэш устарел
+    await status_reconciler.apply_heartbeats([container])
+    if status_reconciler.status_age(container) > STATUS_STALE_AFTER:
+        await query.message.edit_text(texts.get("management.status_check"))
+        await status_reconciler.refresh_statuses([container])
+
+    text = texts.get("management.menu_title", container_name=container['name'], status=container['status'],
+                     updated=status_reconciler.format_status_age(container))
+    if container['suspended']:
+        text += texts.get("management.suspended_note")
+    elif billing.ENABLED:
+        text += texts.get("management.paid_until", paid_until=billing.format_paid_until(container['paid_until']))
+    usage = await metering.get_container_usage(container)
+    if usage:
+        text += texts.get("management.usage", cpu=f"{usage['cpu']:.1f}", cpu_avg=f"{usage['cpu_avg']:.1f}",
+                          memory=round(usage['memory_mb']), memory_avg=round(usage['memory_avg']))
 
     await query.message.edit_text(
-        texts.get("management.menu_title", container_name=container['name'], status=status),
+        text,
         parse_mode="HTML",
         reply_markup=management_keyboard(container, container_db_id)
     )
@@ -50,12 +60,16 @@ async def manage_container_handler(query: CallbackQuery):
 async def toggle_container_state(query: CallbackQuery, action: str):
     container_db_id = int(query.data.split("_")[1])
     user_id = query.from_user.id
-    container = db.get_container_by_db_id(container_db_id)
+    container = await db.get_container_by_db_id(container_db_id)
 
     if not container or container['user_id'] != user_id:
         await query.answer(texts.get("management.container_not_found"), show_alert=True)
         return
         
+    if action == "start" and container['suspended']:
+        await query.answer(texts.get("billing.suspended_alert"), show_alert=True)
+        return
+
     server = SERVERS[container['server_index']]
     await query.message.edit_text(texts.get("management.action_progress", action=action))
 
@@ -69,7 +83,7 @@ async def toggle_container_state(query: CallbackQuery, action: str):
         new_status = "running" if success else "error"
 
     if success:
-        db.update_container_status(container_db_id, new_status)
+        await db.update_container_status(container_db_id, new_status)
         await query.answer(texts.get("management.action_success", action=action))
         query.data = f"manage_container_{container_db_id}" 
         await manage_container_handler(query)
@@ -101,48 +115,26 @@ async def confirm_action_handler(query: CallbackQuery):
     _, action, container_db_id_str = query.data.split("_")
     container_db_id = int(container_db_id_str)
     user_id = query.from_user.id
-    container = db.get_container_by_db_id(container_db_id)
+    container = await db.get_container_by_db_id(container_db_id)
     
     if not container or container['user_id'] != user_id:
         await query.answer(texts.get("management.container_not_found"), show_alert=True)
         return
 
-    server = SERVERS[container['server_index']]
-    tariff = {"cpu_limit": "0.5", "memory_limit": "256m"}
+    if action == "reinstall" and container['suspended']:
+        await query.answer(texts.get("billing.suspended_alert"), show_alert=True)
+        return
 
+    # Удаление и переустановка выполняются очередью провижининга, она же отредактирует сообщение с результатом
     if action == "delete":
         await query.message.edit_text(texts.get("management.delete_progress"))
-        success = await docker_manager.delete_container(container, server)
-        if success:
-            db.delete_container_by_db_id(container_db_id)
-            user_containers = db.get_user_containers(user_id)
-            await query.message.edit_text(
-                texts.get("management.delete_success"),
-                reply_markup=my_userbots_keyboard(user_containers)
-            )
-        else:
-            await query.message.edit_text(texts.get("management.delete_error"))
-
     elif action == "reinstall":
         await query.message.edit_text(texts.get("management.reinstall_progress"))
-        deleted = await docker_manager.delete_container(container, server)
-        if not deleted:
-            await query.message.edit_text(texts.get("management.reinstall_delete_error"))
-            return
+    else:
+        await query.answer()
+        return
 
-        db.delete_container_by_db_id(container_db_id)
-        new_container_info = await docker_manager.create_container(user_id, server, tariff)
-        
-        if new_container_info:
-            db.add_container(user_id, new_container_info)
-            new_containers = db.get_user_containers(user_id)
-            new_db_id = next(c['id'] for c in new_containers if c['name'] == new_container_info['name'])
-
-            await query.message.edit_text(
-                texts.get("management.reinstall_success"),
-                reply_markup=management_keyboard(new_container_info, new_db_id)
-            )
-        else:
-            await query.message.edit_text(texts.get("management.reinstall_create_error"))
-            
-    await query.answer()
\ No newline at end of file
+    payload = {"container_db_id": container_db_id}
+    await provisioning_queue.enqueue(action, user_id, container['server_index'], payload,
+                                     chat_id=query.message.chat.id, message_id=query.message.message_id)
+    await query.answer()
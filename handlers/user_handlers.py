@@ -2,19 +2,21 @@
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-import random
 import html
 import asyncio
+import logging
 import contextlib
+import datetime
 
 # --- НОВАЯ ОТЛАДКА ---
 print("\n--- [DEBUG] HANDLER-USER.PY ЗАГРУЖЕН (ВЕРСИЯ С БАННЕРОМ) ---\n")
 # --- КОНЕЦ ОТЛАДКИ ---
 
 from keyboards import inline
-from config_loader import PAYMENT, SERVERS, OWNER_ID
+from config_loader import PAYMENT, OWNER_ID
 from utils import database as db
-from services.docker_manager import create_container
+from services import placement, status_reconciler
+from services.provisioning import provisioning_queue
 from states import Replenishment
 from utils.texts import texts
 from utils.message_utils import send_or_edit_message_with_banner
@@ -27,30 +29,28 @@ async def delete_message_after_delay(message: Message, delay: int):
         await message.delete()
 
 @router.message(F.text == "/start")
-async def start_handler(message: Message):
+async def start_handler(message: Message, db_user: dict):
     # --- НОВАЯ ОТЛАДКА ---
     print("\n--- [DEBUG] START HANDLER ВЫЗВАН ---")
     # --- КОНЕЦ ОТЛАДКИ ---
-    user = db.get_or_create_user(message.from_user.id)
     await send_or_edit_message_with_banner(
         event=message,
         text=texts.get("main_menu.welcome"),
-        reply_markup=inline.main_menu_keyboard(user_role=user.get('role'))
+        reply_markup=inline.main_menu_keyboard(user_role=db_user.get('role'))
     )
 
 @router.callback_query(F.data == "start")
-async def start_callback_handler(query: CallbackQuery, state: FSMContext):
+async def start_callback_handler(query: CallbackQuery, state: FSMContext, db_user: dict):
     await state.clear()
-    user = db.get_or_create_user(query.from_user.id)
     await send_or_edit_message_with_banner(
         event=query,
         text=texts.get("main_menu.welcome"),
-        reply_markup=inline.main_menu_keyboard(user_role=user.get('role'))
+        reply_markup=inline.main_menu_keyboard(user_role=db_user.get('role'))
     )
 
 @router.callback_query(F.data == "buy_hosting")
 async def buy_hosting_handler(query: CallbackQuery):
-    tariffs = db.get_tariffs()
+    tariffs = await db.get_tariffs()
     await send_or_edit_message_with_banner(
         event=query,
         text=texts.get("purchase.select_tariff"),
@@ -58,11 +58,11 @@ async def buy_hosting_handler(query: CallbackQuery):
     )
 
 @router.callback_query(F.data.startswith("buy_tariff_"))
-async def buy_tariff_handler(query: CallbackQuery):
+async def buy_tariff_handler(query: CallbackQuery, db_user: dict):
     tariff_id = int(query.data.split("_")[2])
-    tariff = db.get_tariff_by_id(tariff_id)
+    tariff = await db.get_tariff_by_id(tariff_id)
     user_id = query.from_user.id
-    user = db.get_or_create_user(user_id)
+    user = db_user
 
     if not tariff:
         await query.answer(texts.get("purchase.tariff_not_found"), show_alert=True)
@@ -71,34 +71,66 @@ async def buy_tariff_handler(query: CallbackQuery):
         await query.answer(texts.get("purchase.insufficient_funds"), show_alert=True)
         return
     
-    await send_or_edit_message_with_banner(query, texts.get("purchase.creating_container"))
-    
-    db.update_user_balance(user_id, -tariff["price"])
-    server = random.choice(SERVERS)
-    new_container_info = await create_container(user_id, server, tariff)
-    
-    if new_container_info:
-        db.add_container(user_id, new_container_info)
-        await send_or_edit_message_with_banner(
-            event=query,
-            text=texts.get("purchase.creation_success", server_ip=new_container_info['server_ip'], port=new_container_info['port']),
-            reply_markup=inline.main_menu_keyboard(user_role=user.get('role'))
+    # Сервер выбирается с учётом уже выделенных ресурсов; место держится за покупкой,
+    # пока задача на создание не попадёт в очередь (дальше её учитывает сама очередь)
+    async with placement.reserve(tariff) as server_index:
+        if server_index is None:
+            await query.answer(texts.get("purchase.no_capacity"), show_alert=True)
+            return
+
+        # Проверка баланса, списание и постановка задачи - одна транзакция; ключ защищает от повторной обработки того же нажатия
+        chat_id = query.message.chat.id
+        debit, job_id = await db.purchase(
+            user_id, tariff["price"], f"purchase:{query.id}", server_index,
+            {"tariff": tariff, "price": tariff["price"]},
+            chat_id=chat_id, message_id=query.message.message_id,
         )
-    else:
-        db.update_user_balance(user_id, tariff["price"])
-        await send_or_edit_message_with_banner(query, texts.get("purchase.creation_error"))
+        if debit == "insufficient":
+            await query.answer(texts.get("purchase.insufficient_funds"), show_alert=True)
+            return
+        if debit != "ok":
+            # Это нажатие уже обработано - просто убираем часики с кнопки
+            await query.answer(texts.get("errors.already_processing"))
+            return
+
+    # Контейнер создаёт фоновый воркер; он же отредактирует это сообщение по готовности.
+    # Задача уже в БД, поэтому ошибка Telegram здесь не оставит пользователя без контейнера
+    try:
+        message = await send_or_edit_message_with_banner(query, texts.get("purchase.queued"))
+        if message and message.message_id != query.message.message_id:
+            await db.set_job_message(job_id, chat_id, message.message_id)
+    except Exception as e:
+        logging.warning(f"Покупка: не удалось показать статус задачи #{job_id}: {e}")
+    provisioning_queue.wake(server_index)
 
 @router.callback_query(F.data == "my_account")
-async def my_account_handler(query: CallbackQuery):
+async def my_account_handler(query: CallbackQuery, db_user: dict):
     user_id = query.from_user.id
-    user = db.get_or_create_user(user_id)
+    user = db_user
     text = texts.get("account.title", user_id=user_id, balance=user['balance'])
     await send_or_edit_message_with_banner(query, text, inline.my_account_keyboard())
 
+@router.callback_query(F.data == "balance_history")
+async def balance_history_handler(query: CallbackQuery):
+    transactions = await db.get_user_transactions(query.from_user.id)
+    if not transactions:
+        await query.answer(texts.get("account.history_empty"), show_alert=True)
+        return
+    lines = [
+        texts.get("account.history_item",
+                  date=datetime.datetime.fromtimestamp(tx['created_at']).strftime("%d.%m.%Y %H:%M"),
+                  amount=f"{tx['amount']:+d}",
+                  kind=texts.get(f"account.history_kinds.{tx['kind']}"))
+        for tx in transactions
+    ]
+    await send_or_edit_message_with_banner(
+        query, texts.get("account.history_title", items="\n".join(lines)), inline.back_to_account_keyboard()
+    )
+
 @router.callback_query(F.data == "my_userbots")
 async def my_userbots_handler(query: CallbackQuery):
     user_id = query.from_user.id
-    containers = db.get_user_containers(user_id)
+    containers = await db.get_user_containers(user_id)
     if not containers:
         await send_or_edit_message_with_banner(
             event=query,
@@ -106,6 +138,8 @@ async def my_userbots_handler(query: CallbackQuery):
             reply_markup=inline.empty_userbots_keyboard()
         )
     else:
+        # Обновляем только устаревшие статусы: один запрос на сервер, а не на каждый контейнер
+        await status_reconciler.refresh_statuses(containers)
         await send_or_edit_message_with_banner(
             event=query,
             text=texts.get("main_menu.my_userbots_title"),
@@ -119,9 +153,9 @@ async def empty_userbots_warning_handler(query: CallbackQuery):
     await query.answer(texts.get("main_menu.empty_userbots_alert"), show_alert=True)
 
 @router.callback_query(F.data == "cancel_payment")
-async def cancel_payment_handler(query: CallbackQuery, state: FSMContext):
+async def cancel_payment_handler(query: CallbackQuery, state: FSMContext, db_user: dict):
     await state.clear()
-    await my_account_handler(query)
+    await my_account_handler(query, db_user)
 
 @router.callback_query(F.data == "top_up_balance")
 async def top_up_balance_start(query: CallbackQuery, state: FSMContext):
@@ -174,10 +208,11 @@ async def screenshot_received_handler(message: Message, state: FSMContext, bot:
                      f"<b>Пользователь:</b> {full_name} ({username})\n"
                      f"<b>ID:</b> <code>{user.id}</code>\n"
                      f"<b>Сумма:</b> <code>{amount}</code> руб.")
+    request_id = await db.create_payment_request(user.id, amount)
     await bot.send_photo(
         chat_id=OWNER_ID, photo=message.photo[-1].file_id,
         caption=admin_caption, parse_mode="HTML",
-        reply_markup=inline.admin_approval_keyboard(user.id, amount)
+        reply_markup=inline.admin_approval_keyboard(request_id)
     )
     await message.delete()
     screenshot_prompt_id = data.get("screenshot_prompt_id")
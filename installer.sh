@@ -151,7 +151,7 @@ pm2 delete Public-Host || true
 
 echo "Запускаю бота с именем 'Public-Host'..."
 # Запускаем, используя системный python3
-pm2 start bot.py --name Public-Host --interpreter python3
+pm2 start bot.py --name Public-Host --interpreter python3 --kill-timeout 15000
 
 echo "Сохраняю список процессов PM2 для автозапуска после перезагрузки..."
 pm2 save
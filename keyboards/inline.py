@@ -3,6 +3,22 @@ from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from config_loader import PAYMENT
 
+# Количество записей на одной странице списков в админ-панели
+PER_PAGE = 5
+
+# Значки статусов контейнеров в списках
+STATUS_ICONS = {
+    "running": "🟢",
+    "exited": "🔴",
+    "created": "⚪",
+    "paused": "⏸",
+    "restarting": "🔄",
+    "error": "⚠️",
+}
+
+def status_icon(status: str) -> str:
+    return STATUS_ICONS.get(status, "❔")
+
 # --- Клавиатуры пользователя ---
 
 def main_menu_keyboard(user_role: str = 'member'):
@@ -22,9 +38,15 @@ def main_menu_keyboard(user_role: str = 'member'):
 def my_account_keyboard():
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="💰 Пополнить баланс", callback_data="top_up_balance"))
+    builder.row(InlineKeyboardButton(text="📜 История операций", callback_data="balance_history"))
     builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="start"))
     return builder.as_markup()
 
+def back_to_account_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="my_account"))
+    return builder.as_markup()
+
 def payment_confirmation_keyboard():
     builder = InlineKeyboardBuilder()
     builder.row(
@@ -53,7 +75,7 @@ def my_userbots_keyboard(user_containers: list):
     builder = InlineKeyboardBuilder()
     for container in user_containers:
         builder.row(InlineKeyboardButton(
-            text=f"⚙️ {container['name']}",
+            text=f"{status_icon(container['status'])} {container['name']}",
             callback_data=f"manage_container_{container['id']}" 
         ))
     builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="start"))
@@ -95,11 +117,11 @@ def confirm_action_keyboard(action: str, container_db_id: int):
 
 # --- Клавиатуры админ-панели ---
 
-def admin_approval_keyboard(user_id: int, amount: int):
+def admin_approval_keyboard(request_id: int):
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{user_id}_{amount}"),
-        InlineKeyboardButton(text="❌ Отклонить", callback_data=f"decline_{user_id}_{amount}")
+        InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{request_id}"),
+        InlineKeyboardButton(text="❌ Отклонить", callback_data=f"decline_{request_id}")
     )
     return builder.as_markup()
 
@@ -110,16 +132,19 @@ def admin_main_keyboard():
         InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users"),
         InlineKeyboardButton(text="🐳 Контейнеры", callback_data="admin_containers")
     )
+    builder.row(
+        InlineKeyboardButton(text="📊 Нагрузка серверов", callback_data="admin_usage"),
+        InlineKeyboardButton(text="🖼 Образ на серверах", callback_data="admin_images")
+    )
     builder.row(InlineKeyboardButton(text="⚙️ Настройки бота (Тарифы)", callback_data="admin_settings"))
     builder.row(InlineKeyboardButton(text="⬅️ Выйти из админки", callback_data="start"))
     return builder.as_markup()
 
-def admin_users_list_keyboard(users_info: list, page: int = 0):
+def admin_users_list_keyboard(users_page: list, page: int, total: int):
     builder = InlineKeyboardBuilder()
-    per_page = 5
-    start, end = page * per_page, (page + 1) * per_page
-    
-    for user in users_info[start:end]:
+    end = (page + 1) * PER_PAGE
+
+    for user in users_page:
         status = "🔴" if user['is_blocked'] else "🟢"
         builder.row(InlineKeyboardButton(
             text=f"{status} ID: {user['user_id']} | 🐳: {user['container_count']}",
@@ -129,7 +154,7 @@ def admin_users_list_keyboard(users_info: list, page: int = 0):
     pagination_buttons = []
     if page > 0:
         pagination_buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"admin_users_page_{page-1}"))
-    if end < len(users_info):
+    if end < total:
         pagination_buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"admin_users_page_{page+1}"))
     
     # Кнопки пагинации будут в одном ряду
@@ -150,21 +175,20 @@ def admin_user_manage_keyboard(user_id: int, is_blocked: bool):
     builder.row(InlineKeyboardButton(text="⬅️ К списку пользователей", callback_data="admin_users"))
     return builder.as_markup()
 
-def admin_containers_list_keyboard(all_containers: list, page: int = 0):
+def admin_containers_list_keyboard(page_containers: list, page: int, total: int):
     builder = InlineKeyboardBuilder()
-    per_page = 5
-    start, end = page * per_page, (page + 1) * per_page
+    end = (page + 1) * PER_PAGE
 
-    for container in all_containers[start:end]:
+    for container in page_containers:
         builder.row(InlineKeyboardButton(
-            text=f"🐳 {container['name']} (ID: {container['user_id']})",
+            text=f"{status_icon(container['status'])} {container['name']} (ID: {container['user_id']})",
             callback_data=f"admin_manage_container_{container['id']}"
         ))
 
     pagination_buttons = []
     if page > 0:
         pagination_buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"admin_containers_page_{page-1}"))
-    if end < len(all_containers):
+    if end < total:
         pagination_buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"admin_containers_page_{page+1}"))
     
     if pagination_buttons:
@@ -173,6 +197,12 @@ def admin_containers_list_keyboard(all_containers: list, page: int = 0):
     builder.row(InlineKeyboardButton(text="⬅️ Назад в админ-панель", callback_data="admin_panel"))
     return builder.as_markup()
 
+def admin_images_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="🔄 Скачать образ заново", callback_data="admin_images_pull"))
+    builder.row(InlineKeyboardButton(text="⬅️ Назад в админ-панель", callback_data="admin_panel"))
+    return builder.as_markup()
+
 def admin_settings_keyboard():
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="📋 Управление тарифами", callback_data="admin_tariffs"))
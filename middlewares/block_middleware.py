@@ -1,7 +1,7 @@
 # middlewares/block_middleware.py
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject, Message, CallbackQuery
+from aiogram.types import TelegramObject, Message, CallbackQuery, Update
 
 from utils import database as db
 from utils.texts import texts # <-- НОВЫЙ ИМПОРТ
@@ -13,22 +13,26 @@ class BlockMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        if not isinstance(event, (Message, CallbackQuery)):
+        # Middleware висит на dp.update, поэтому сюда приходит Update - достаём из него сообщение/колбэк
+        inner_event = event.event if isinstance(event, Update) else event
+        if not isinstance(inner_event, (Message, CallbackQuery)):
             return await handler(event, data)
 
-        user_id = event.from_user.id
-        user_data = db.get_or_create_user(user_id)
+        user_id = inner_event.from_user.id
+        user_data = await db.get_or_create_user(user_id)
+        # Передаём запись пользователя дальше, чтобы фильтры и хендлеры не запрашивали её повторно
+        data["db_user"] = user_data
 
         # Администраторы не могут быть заблокированы
         if user_data.get("role") == "admin":
             return await handler(event, data)
-        
+
         # Проверяем, заблокирован ли обычный пользователь
         if user_data.get("is_blocked", False):
-            if isinstance(event, CallbackQuery):
+            if isinstance(inner_event, CallbackQuery):
                 # ИСПОЛЬЗУЕМ ТЕКСТ ИЗ texts.json
-                await event.answer(texts.get("errors.access_denied"), show_alert=True)
+                await inner_event.answer(texts.get("errors.access_denied"), show_alert=True)
             return # Прерываем обработку
 
         # Если пользователь не заблокирован, продолжаем
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
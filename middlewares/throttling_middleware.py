@@ -0,0 +1,106 @@
+# middlewares/throttling_middleware.py
+import time
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Message, CallbackQuery, Update
+
+from utils.texts import texts
+
+# Колбэки, за которыми стоят команды Docker по SSH или задачи провижининга; остальные - переходы по меню
+EXPENSIVE_PREFIXES = (
+    "manage_container_", "start_", "stop_", "confirm_", "buy_tariff_", "my_userbots",
+    "admin_containers", "admin_manage_container_", "admin_images_pull",
+)
+
+
+class TokenBucket:
+    """Ведро токенов: capacity запросов подряд, дальше - rate запросов в секунду."""
+
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, capacity: float, rate: float) -> bool:
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничивает частоту запросов пользователя отдельными бюджетами для дешёвых (меню)
+    и дорогих (Docker) действий и отбрасывает повторное нажатие той же кнопки, пока первое ещё обрабатывается.
+    Ставится после BlockMiddleware: администраторы ограничениям частоты не подвержены.
+    """
+
+    def __init__(self, cheap: dict | None = None, expensive: dict | None = None, max_users: int = 10000):
+        cheap = cheap or {}
+        expensive = expensive or {}
+        # {класс: (ёмкость, пополнение в секунду)}
+        self.budgets = {
+            "cheap": (cheap.get("burst", 10), cheap.get("rate", 2)),
+            "expensive": (expensive.get("burst", 3), expensive.get("rate", 0.2)),
+        }
+        self.max_users = max_users
+        self._buckets: dict[tuple, TokenBucket] = {}
+        # Колбэки, которые сейчас обрабатываются: {(user_id, callback_data)}
+        self._in_flight: set[tuple] = set()
+
+    def _allow(self, user_id: int, kind: str) -> bool:
+        capacity, rate = self.budgets[kind]
+        bucket = self._buckets.get((user_id, kind))
+        if bucket is None:
+            if len(self._buckets) >= self.max_users:
+                self._forget_idle()
+            bucket = self._buckets[(user_id, kind)] = TokenBucket(capacity)
+        return bucket.consume(capacity, rate)
+
+    def _forget_idle(self):
+        """Удаляет вёдра, которые успели наполниться полностью: они ничем не отличаются от новых."""
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            capacity, rate = self.budgets[key[1]]
+            if bucket.tokens + (now - bucket.updated_at) * rate >= capacity:
+                del self._buckets[key]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        inner_event = event.event if isinstance(event, Update) else event
+        if not isinstance(inner_event, (Message, CallbackQuery)):
+            return await handler(event, data)
+
+        user_id = inner_event.from_user.id
+        is_admin = (data.get("db_user") or {}).get("role") == "admin"
+
+        if isinstance(inner_event, Message):
+            if is_admin or self._allow(user_id, "cheap"):
+                return await handler(event, data)
+            return
+
+        callback_data = inner_event.data or ""
+        key = (user_id, callback_data)
+        if key in self._in_flight:
+            # Двойное нажатие: первый запрос ещё выполняется
+            await inner_event.answer(texts.get("errors.already_processing"))
+            return
+
+        kind = "expensive" if callback_data.startswith(EXPENSIVE_PREFIXES) else "cheap"
+        if not is_admin and not self._allow(user_id, kind):
+            await inner_event.answer(texts.get("errors.too_many_requests"), show_alert=kind == "expensive")
+            return
+
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
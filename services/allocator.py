@@ -0,0 +1,49 @@
+# services/allocator.py
+import asyncio
+import logging
+
+from config_loader import SERVERS
+from services import docker_manager
+from utils import database as db
+
+# Диапазон портов хоста, которые выдаются контейнерам
+PORT_RANGE = (10000, 65535)
+
+
+async def allocate(server_index: int, user_id: int):
+    """Резервирует на сервере порт и имя для нового контейнера пользователя. Возвращает (port, name) или None."""
+    allocated = await db.allocate_port_and_name(
+        server_index,
+        lambda: f"Public{docker_manager.generate_random_string()}-Host-{user_id}",
+        PORT_RANGE,
+    )
+    if allocated is None:
+        logging.error(f"На сервере #{server_index} не осталось свободных портов")
+    return allocated
+
+async def allocate_warm(server_index: int):
+    """Резервирует порт и имя для заготовки из пула. Имя не содержит "-Host-", поэтому опрос статусов её не видит."""
+    return await db.allocate_port_and_name(
+        server_index,
+        lambda: f"PublicWarm{docker_manager.generate_random_string(8)}",
+        PORT_RANGE,
+    )
+
+async def release(server_index: int, port: int):
+    """Освобождает порт, если контейнер так и не был создан."""
+    await db.release_port(server_index, port)
+
+async def sync_host_ports():
+    """
+    Один раз при старте сверяется с портами, которые реально слушают серверы,
+    и помечает занятые сторонними процессами, чтобы не выдавать их контейнерам.
+    """
+    async def _sync(server_index: int, server: dict):
+        ports = await docker_manager.get_listening_ports(server)
+        if ports is None:
+            return
+        in_range = [port for port in ports if PORT_RANGE[0] <= port <= PORT_RANGE[1]]
+        await db.replace_host_ports(server_index, in_range)
+        logging.info(f"Сервер {server['ip']}: учтено {len(in_range)} занятых портов")
+
+    await asyncio.gather(*(_sync(index, server) for index, server in enumerate(SERVERS)))
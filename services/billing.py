@@ -0,0 +1,100 @@
+# services/billing.py
+import asyncio
+import datetime
+import logging
+
+from aiogram import Bot
+
+from config_loader import SERVERS, BILLING
+from services import docker_manager
+from utils import database as db
+from utils import outbound
+from utils.texts import texts
+
+ENABLED = BILLING.get("enabled", False)
+PERIOD = BILLING.get("period_days", 30) * 86400
+INTERVAL = BILLING.get("interval", 300)
+WARN_AHEAD = BILLING.get("warn_days", 3) * 86400
+
+
+def format_paid_until(timestamp: int | None) -> str:
+    if not timestamp:
+        return "—"
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%d.%m.%Y %H:%M")
+
+async def _set_running(containers: list, start: bool):
+    """
+    Пакетно останавливает или запускает контейнеры: одна команда docker на сервер.
+    Статус в БД меняется только на серверах, где команда прошла.
+    """
+    by_server = {}
+    for container in containers:
+        by_server.setdefault(container['server_index'], []).append(container)
+    action = docker_manager.start_containers if start else docker_manager.stop_containers
+    results = await asyncio.gather(*(
+        action(SERVERS[index], [c['container_id'] for c in group]) for index, group in by_server.items()
+    ))
+    status = "running" if start else "exited"
+    statuses = {}
+    for (index, group), ok in zip(by_server.items(), results):
+        if ok:
+            statuses.update({c['id']: status for c in group})
+        else:
+            logging.error(f"Биллинг: не удалось {'запустить' if start else 'остановить'} "
+                          f"{len(group)} контейнеров на сервере {SERVERS[index]['ip']}")
+    if statuses:
+        await db.update_container_statuses(statuses)
+
+async def _send(bot: Bot, user_id: int, text: str):
+    try:
+        with outbound.background():
+            await bot.send_message(user_id, text, parse_mode="HTML")
+    except Exception as e:
+        logging.warning(f"Биллинг: не удалось уведомить {user_id}: {e}")
+
+async def billing_cycle(bot: Bot):
+    """Списывает оплату за истёкшие периоды, приостанавливает неоплаченные контейнеры и рассылает предупреждения."""
+    result = await db.charge_due_containers(PERIOD)
+    if result["charged"] or result["suspended"]:
+        logging.info(f"Биллинг: продлено у {len(result['charged'])} пользователей, "
+                     f"приостановлено {len(result['suspended'])} контейнеров")
+
+    # Контейнеры, которые не удалось остановить в прошлых циклах (статус в БД не exited), - ещё одна попытка
+    just_suspended = {c['id'] for c in result["suspended"]}
+    unstopped = [c for c in await db.get_running_suspended_containers() if c['id'] not in just_suspended]
+    if unstopped:
+        await _set_running(unstopped, start=False)
+
+    if result["suspended"]:
+        await _set_running(result["suspended"], start=False)
+        names_by_user = {}
+        for container in result["suspended"]:
+            names_by_user.setdefault(container['user_id'], []).append(container['name'])
+        for user_id, names in names_by_user.items():
+            await _send(bot, user_id, texts.get("billing.suspended", names=", ".join(names)))
+
+    for user in await db.get_users_to_warn(WARN_AHEAD):
+        await _send(bot, user['user_id'], texts.get(
+            "billing.low_balance", balance=user['balance'], total=user['total'],
+            paid_until=format_paid_until(user['paid_until'])
+        ))
+
+async def resume_user(bot: Bot, user_id: int):
+    """Вызывается после пополнения баланса: запускает приостановленные контейнеры, на которые хватает денег."""
+    if not ENABLED:
+        return
+    resumed = await db.resume_user_containers(user_id, PERIOD)
+    if resumed:
+        await _set_running(resumed, start=True)
+        await _send(bot, user_id, texts.get("billing.resumed", names=", ".join(c['name'] for c in resumed)))
+
+async def run_billing(bot: Bot, interval: int = INTERVAL):
+    """Фоновая задача периодической оплаты контейнеров."""
+    if not ENABLED:
+        return
+    while True:
+        try:
+            await billing_cycle(bot)
+        except Exception as e:
+            logging.error(f"Ошибка цикла биллинга: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,124 @@
+# services/container_events.py
+import asyncio
+import contextlib
+import logging
+import re
+
+from aiogram import Bot
+
+from config_loader import SERVERS, CONTAINER_EVENTS, STATUS_STALE_AFTER
+from services import docker_manager, status_reconciler
+from utils import database as db
+from utils import outbound
+from utils.texts import texts
+
+ENABLED = CONTAINER_EVENTS.get("enabled", True)
+NOTIFY_OWNER = CONTAINER_EVENTS.get("notify_owner", True)
+RECONNECT_DELAY = CONTAINER_EVENTS.get("reconnect_delay", 5)
+
+# Контейнеры хостинга; заготовки из пула (PublicWarm...) и чужие контейнеры не учитываются
+CONTAINER_NAME = re.compile(r"^Public\w+-Host-\d+$")
+
+# Статус, в который переводит контейнер событие Docker
+EVENT_STATUSES = {
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "die": "exited",
+    "pause": "paused",
+    "destroy": "unknown",
+}
+# Коды выхода при штатной остановке: docker stop (SIGTERM), docker kill / rm -f (SIGKILL) и обычное завершение
+EXPECTED_EXIT_CODES = {"0", "137", "143"}
+
+
+class ContainerEventListener:
+    """
+    Держит по одному потоку `docker events` на сервер и сразу записывает смену статусов в БД.
+    Пока поток сервера жив, его статусы считаются актуальными и опрос не нужен;
+    после переподключения статусы сервера сверяются одним `docker ps`.
+    """
+
+    def __init__(self):
+        self.bot: Bot | None = None
+        # Серверы, поток событий которых сейчас подключён
+        self._live: set[int] = set()
+        # Контейнеры, для которых пришло событие oom, но ещё не пришло die: {(server_index, name)}
+        self._oom: set[tuple] = set()
+
+    async def run(self, bot: Bot):
+        self.bot = bot
+        await asyncio.gather(
+            self._keep_fresh(),
+            *(self._listen(index, server) for index, server in enumerate(SERVERS)),
+        )
+
+    async def _resync(self, server_index: int):
+        containers = [c for c in await db.get_all_containers_info() if c['server_index'] == server_index]
+        await status_reconciler.refresh_statuses(containers, only_stale=False)
+        self._live.add(server_index)
+
+    async def _listen(self, server_index: int, server: dict):
+        while True:
+            try:
+                async for event in docker_manager.stream_events(server, lambda: self._resync(server_index)):
+                    await self._handle_event(server_index, event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"События Docker: поток с {server['ip']} оборвался: {e}")
+            self._live.discard(server_index)
+            # Без потока статусы сервера снова проверяются опросом
+            with contextlib.suppress(Exception):
+                await db.clear_server_heartbeat(server_index)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _keep_fresh(self):
+        """
+        Обновляет пульс серверов с живым потоком, чтобы экраны не запрашивали их статусы заново.
+        Одна строка на сервер, а не на каждый контейнер.
+        """
+        while True:
+            for server_index in list(self._live):
+                with contextlib.suppress(Exception):
+                    await db.touch_server_heartbeat(server_index)
+            await asyncio.sleep(max(STATUS_STALE_AFTER / 2, 1))
+
+    async def _handle_event(self, server_index: int, event: dict):
+        action = event.get("Action") or event.get("status", "")
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        name = attributes.get("name", "")
+        if not CONTAINER_NAME.match(name):
+            return
+
+        key = (server_index, name)
+        if action == "oom":
+            self._oom.add(key)
+            return
+        new_status = EVENT_STATUSES.get(action)
+        if new_status is None:
+            return
+
+        container = await db.set_container_status_by_name(server_index, name, new_status)
+        if action != "die":
+            return
+        killed_by_oom = key in self._oom
+        self._oom.discard(key)
+        exit_code = attributes.get("exitCode", "")
+        if container and NOTIFY_OWNER and (killed_by_oom or exit_code not in EXPECTED_EXIT_CODES):
+            await self._notify_owner(container, killed_by_oom, exit_code)
+
+    async def _notify_owner(self, container: dict, killed_by_oom: bool, exit_code: str):
+        if self.bot is None:
+            return
+        text = texts.get("events.container_oom" if killed_by_oom else "events.container_died",
+                         name=container['name'], exit_code=exit_code)
+        try:
+            with outbound.background():
+                await self.bot.send_message(container['user_id'], text, parse_mode="HTML")
+        except Exception as e:
+            logging.warning(f"События Docker: не удалось уведомить {container['user_id']}: {e}")
+
+
+# Единый слушатель событий, который используется во всем боте
+container_events = ContainerEventListener()
@@ -0,0 +1,263 @@
+# services/docker_api.py
+"""
+Бэкенд docker_manager, который работает с Docker Engine API напрямую через
+/var/run/docker.sock, проброшенный по SSH-соединению из пула (docker_backend = "api").
+Вместо запуска процесса `docker` на сервере и разбора его вывода каждый вызов - один
+HTTP-запрос с JSON-ответом. Функции повторяют сигнатуры и возвращаемые значения CLI-версий.
+"""
+import json
+import logging
+from urllib.parse import quote, urlencode
+
+from config_loader import SERVERS, DOCKER_IMAGE
+from services import docker_manager
+from services.ssh_pool import ssh_pool, CONNECTION_ERRORS
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+
+
+class DockerAPIError(Exception):
+    """Docker Engine ответил ошибкой (код 4xx/5xx)."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+# --- Минимальный HTTP/1.1-клиент поверх unix-сокета ---
+
+def _dechunk(body: bytes) -> bytes:
+    """Собирает тело ответа с Transfer-Encoding: chunked."""
+    result, position = bytearray(), 0
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        if size == 0:
+            return bytes(result)
+        start = line_end + 2
+        result += body[start:start + size]
+        position = start + size + 2
+
+def _parse_response(raw: bytes):
+    head, _, body = raw.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = _dechunk(body)
+
+    text = body.decode("utf-8", errors="replace")
+    try:
+        data = json.loads(text) if text.strip() else None
+    except json.JSONDecodeError:
+        # Потоковые ответы (например, pull) - это несколько JSON-объектов подряд
+        data = text
+    return status, data
+
+async def _request(server: dict, method: str, path: str, body: dict | None = None, retries: int = 0):
+    """
+    Выполняет HTTP-запрос к Docker Engine на сервере. Возвращает (код ответа, JSON или текст).
+    При обрыве SSH-соединения переподключается и повторяет запрос до `retries` раз.
+    """
+    payload = json.dumps(body).encode() if body is not None else b""
+    request = (
+        f"{method} {path} HTTP/1.1\r\n"
+        f"Host: docker\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: close\r\n\r\n"
+    ).encode() + payload
+
+    for attempt in range(retries + 1):
+        try:
+            async with ssh_pool.connection(server) as conn:
+                reader, writer = await conn.open_unix_connection(DOCKER_SOCKET)
+                try:
+                    writer.write(request)
+                    raw = await reader.read()
+                finally:
+                    writer.close()
+            return _parse_response(raw)
+        except CONNECTION_ERRORS as e:
+            if attempt == retries:
+                raise
+            logging.warning(f"Docker API: соединение с {server['ip']} потеряно ({e}), переподключаюсь...")
+
+async def _call(server: dict, method: str, path: str, body: dict | None = None, ok_statuses=()):
+    """_request, который бросает DockerAPIError на ответ с ошибкой (кроме кодов из ok_statuses)."""
+    # Повтор после обрыва только для чтения: POST/DELETE мог уже выполниться на сервере до обрыва
+    status, data = await _request(server, method, path, body, retries=1 if method == "GET" else 0)
+    if status >= 400 and status not in ok_statuses:
+        message = data.get("message", "") if isinstance(data, dict) else str(data)
+        raise DockerAPIError(status, message)
+    return status, data
+
+# --- Операции с контейнерами ---
+
+def _memory_bytes(memory_limit: str) -> int:
+    return int(float(memory_limit[:-1]) * (1024 ** 3 if memory_limit.endswith('g') else 1024 ** 2))
+
+def _limits_config(tariff: dict) -> dict:
+    cpu_limit, memory_limit = docker_manager._tariff_limits(tariff)
+    memory = _memory_bytes(memory_limit)
+    # Как и `docker run -m`, разрешаем swap в размере лимита памяти
+    return {"NanoCpus": int(float(cpu_limit) * 1e9), "Memory": memory, "MemorySwap": memory * 2}
+
+async def _create(server: dict, container_name: str, host_port: int, limits: dict | None = None) -> str:
+    """POST /containers/create; если образа на сервере нет - скачивает его и повторяет."""
+    host_config = {"PortBindings": {"8080/tcp": [{"HostPort": str(host_port)}]}}
+    host_config.update(limits or {})
+    config = {
+        "Image": docker_manager._image_for(server),
+        "Hostname": "PublicHost",
+        "ExposedPorts": {"8080/tcp": {}},
+        "HostConfig": host_config,
+    }
+    path = f"/containers/create?{urlencode({'name': container_name})}"
+    status, data = await _call(server, "POST", path, config, ok_statuses=(404, 409))
+    if status == 404:
+        await _pull(server, config["Image"])
+        status, data = await _call(server, "POST", path, config, ok_statuses=(409,))
+    if status == 409:
+        # Имя занято: скорее всего, это наш же контейнер, созданный запросом, ответ на который потерялся
+        _, data = await _call(server, "GET", f"/containers/{quote(container_name)}/json")
+    return data["Id"]
+
+async def _start(server: dict, container_docker_id: str):
+    # 304 - контейнер уже запущен
+    await _call(server, "POST", f"/containers/{quote(container_docker_id)}/start")
+
+async def create_container(user_id, server, tariff, host_port, container_name):
+    try:
+        container_id = await _create(server, container_name, host_port, _limits_config(tariff))
+        await _start(server, container_id)
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Ошибка Docker API при создании контейнера: {e}")
+        return None
+    return {
+        "id": container_id,
+        "name": container_name,
+        "server_ip": server["ip"],
+        "port": host_port,
+        "status": "running",
+        "server_index": SERVERS.index(server),
+        "tariff_id": tariff.get("id")
+    }
+
+async def create_stopped_container(server, host_port, container_name):
+    try:
+        return await _create(server, container_name, host_port)
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Ошибка Docker API при создании заготовки контейнера: {e}")
+        return None
+
+async def activate_container(server, container_docker_id, tariff, new_name):
+    container_path = f"/containers/{quote(container_docker_id)}"
+    try:
+        await _call(server, "POST", f"{container_path}/update", _limits_config(tariff))
+        await _call(server, "POST", f"{container_path}/rename?{urlencode({'name': new_name})}")
+        await _start(server, container_docker_id)
+        return True
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Ошибка Docker API при активации заготовки контейнера: {e}")
+        return False
+
+async def recreate_container(server, container, tariff):
+    try:
+        await _call(server, "DELETE", f"/containers/{quote(container['name'])}?force=true", ok_statuses=(404,))
+        container_id = await _create(server, container['name'], container['port'], _limits_config(tariff))
+        await _start(server, container_id)
+        return container_id
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Ошибка Docker API при переустановке контейнера: {e}")
+        return None
+
+async def _inspect(server, container):
+    container_docker_id = container.get('container_id') or container.get('id')
+    return await _call(server, "GET", f"/containers/{quote(container_docker_id)}/json", ok_statuses=(404,))
+
+async def get_container_limits(container, server):
+    try:
+        status, data = await _inspect(server, container)
+    except (DockerAPIError, *CONNECTION_ERRORS):
+        return None
+    if status == 404:
+        return None
+    nano_cpus, memory = data["HostConfig"].get("NanoCpus"), data["HostConfig"].get("Memory")
+    if not nano_cpus or not memory:
+        return None
+    return {"cpu_limit": str(nano_cpus / 1e9), "memory_limit": f"{memory // (1024 * 1024)}m"}
+
+async def get_container_status(container, server):
+    try:
+        status, data = await _inspect(server, container)
+    except (DockerAPIError, *CONNECTION_ERRORS):
+        return "error"
+    return "unknown" if status == 404 else data["State"]["Status"]
+
+async def list_server_containers(server):
+    query = urlencode({"all": "1", "filters": json.dumps({"name": ["-Host-"]})})
+    try:
+        _, entries = await _call(server, "GET", f"/containers/json?{query}")
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Ошибка Docker API при получении списка контейнеров с {server['ip']}: {e}")
+        return None
+
+    states = {}
+    for entry in entries:
+        state = entry.get("State", "unknown")
+        states[entry["Id"]] = state
+        for name in entry.get("Names", []):
+            states[name.lstrip("/")] = state
+    return states
+
+async def _container_action(container, server, method: str, action: str, ok_statuses=()):
+    container_docker_id = container.get('container_id') or container.get('id')
+    try:
+        await _call(server, method, f"/containers/{quote(container_docker_id)}{action}", ok_statuses=ok_statuses)
+        return True
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Ошибка Docker API: {e}")
+        return False
+
+async def stop_container(container, server):
+    return await _container_action(container, server, "POST", "/stop")
+
+async def start_container(container, server):
+    return await _container_action(container, server, "POST", "/start")
+
+async def delete_container(container, server):
+    # 404 - контейнера уже нет, удалять нечего
+    return await _container_action(container, server, "DELETE", "?force=true", ok_statuses=(404,))
+
+# --- Сервер и образы ---
+
+async def get_server_capacity(server):
+    try:
+        _, info = await _call(server, "GET", "/info")
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Не удалось получить ресурсы сервера {server['ip']}: {e}")
+        return None
+    return {"cpu": float(info["NCPU"]), "memory_mb": int(info["MemTotal"]) // (1024 * 1024)}
+
+async def _pull(server: dict, image: str):
+    """POST /images/create. Ошибка загрузки приходит внутри потока прогресса с кодом 200."""
+    _, data = await _call(server, "POST", f"/images/create?{urlencode({'fromImage': image})}")
+    events = [data] if isinstance(data, dict) else [
+        json.loads(line) for line in str(data or "").splitlines() if line.strip().startswith("{")
+    ]
+    for event in events:
+        if event.get("error"):
+            raise DockerAPIError(500, event["error"])
+
+async def pull_image(server, image=DOCKER_IMAGE):
+    try:
+        await _pull(server, image)
+        _, data = await _call(server, "GET", f"/images/{quote(image)}/json")
+    except (DockerAPIError, *CONNECTION_ERRORS) as e:
+        print(f"Ошибка Docker API при загрузке образа на {server['ip']}: {e}")
+        return None
+    return (data.get("RepoDigests") or [data["Id"]])[0]
@@ -1,93 +1,361 @@
 # services/docker_manager.py
-import asyncssh
+import asyncio
+import json
 import random
 import string
-from config_loader import DOCKER_IMAGE
+from config_loader import DOCKER_IMAGE, DOCKER_BACKEND
+from services.ssh_pool import ssh_pool
+
+# Образ, закреплённый за сервером по digest (заполняет services.image_manager): {server_index: "repo@sha256:..."}
+_pinned_images: dict[int, str] = {}
+
+def pin_image(server_index: int, image_ref: str):
+    _pinned_images[server_index] = image_ref
+
+def _image_for(server) -> str:
+    """Ссылка на образ для сервера: закреплённый digest или тег из конфига, пока digest неизвестен."""
+    from config_loader import SERVERS
+    return _pinned_images.get(SERVERS.index(server), DOCKER_IMAGE)
 
 def generate_random_string(length=4):
     letters = string.ascii_uppercase
     return ''.join(random.choice(letters) for i in range(length))
 
-async def create_container(user_id, server, tariff):
-    """Создает и запускает Docker контейнер на удаленном сервере с учетом лимитов."""
-    # ГАРАНТИРОВАННОЕ ИСПРАВЛЕНИЕ: Импортируем SERVERS прямо здесь.
-    # Это решает все проблемы с порядком загрузки модулей.
-    from config_loader import SERVERS
-
-    host_port = random.randint(10000, 65535)
-    random_part = generate_random_string()
-    container_name = f"Public{random_part}-Host-{user_id}"
-    
+def _tariff_limits(tariff):
+    """Проверенные лимиты CPU и RAM тарифа в формате Docker (с безопасными значениями по умолчанию)."""
     try:
         cpu_limit_val = float(tariff.get("cpu_limit", "0.5"))
         cpu_limit = "0.5" if cpu_limit_val <= 0 else str(cpu_limit_val)
     except (ValueError, TypeError):
         cpu_limit = "0.5"
 
-    memory_limit_val = tariff.get("memory_limit", "256m")
-    memory_limit = memory_limit_val if isinstance(memory_limit_val, str) and (memory_limit_val.endswith('m') or memory_limit_val.endswith('g')) else "256m"
+    memory_limit = tariff.get("memory_limit", "256m")
+    # Число с единицей m или g, больше нуля: иначе Engine API не разберёт лимит, а Memory = 0 снимет его вовсе
+    try:
+        if not (isinstance(memory_limit, str) and memory_limit[-1:] in ('m', 'g') and 0 < float(memory_limit[:-1]) < float("inf")):
+            memory_limit = "256m"
+    except ValueError:
+        memory_limit = "256m"
+    return cpu_limit, memory_limit
+
+async def create_container(user_id, server, tariff, host_port, container_name):
+    """
+    Создает и запускает Docker контейнер на удаленном сервере с учетом лимитов.
+    Порт и имя должны быть заранее зарезервированы через services.allocator.
+    """
+    # ГАРАНТИРОВАННОЕ ИСПРАВЛЕНИЕ: Импортируем SERVERS прямо здесь.
+    # Это решает все проблемы с порядком загрузки модулей.
+    from config_loader import SERVERS
+
+    cpu_limit, memory_limit = _tariff_limits(tariff)
 
     command = (
         f"docker run -d --name {container_name} "
         f"--hostname PublicHost "
         f"--cpus=\"{cpu_limit}\" "
         f"-m=\"{memory_limit}\" "
-        f"-p {host_port}:8080 {DOCKER_IMAGE}"
+        f"-p {host_port}:8080 {_image_for(server)}"
     )
     print(f"Executing Docker command: {command}")
 
     try:
-        async with asyncssh.connect(
-            server["ip"], port=server["port"], username=server["user"],
-            password=server["pass"], known_hosts=None
-        ) as conn:
-            check_command = f"docker ps -a --filter name=^{container_name}$ --format '{{{{.Names}}}}'"
-            check_result = await conn.run(check_command)
-            if check_result.stdout.strip():
-                return await create_container(user_id, server, tariff)
-
-            result = await conn.run(command)
-            if result.exit_status == 0:
-                container_id = result.stdout.strip()
-                return {
-                    "id": container_id,
-                    "name": container_name,
-                    "server_ip": server["ip"],
-                    "port": host_port,
-                    "status": "running",
-                    "server_index": SERVERS.index(server)
-                }
-            else:
-                print(f"Ошибка Docker: {result.stderr}")
-                return None
+        result = await ssh_pool.run(server, command)
+        if result.exit_status == 0:
+            container_id = result.stdout.strip()
+            return {
+                "id": container_id,
+                "name": container_name,
+                "server_ip": server["ip"],
+                "port": host_port,
+                "status": "running",
+                "server_index": SERVERS.index(server),
+                "tariff_id": tariff.get("id")
+            }
+        else:
+            print(f"Ошибка Docker: {result.stderr}")
+            return None
     except Exception as e:
         print(f"Ошибка SSH при создании контейнера: {e}")
         return None
 
+async def recreate_container(server, container, tariff):
+    """
+    Переустанавливает контейнер за один SSH-запрос: удаляет старый и запускает новый
+    с тем же именем, портом и лимитами тарифа. Возвращает новый docker id или None.
+    """
+    cpu_limit, memory_limit = _tariff_limits(tariff)
+    command = (
+        f"docker rm -f {container['name']} >/dev/null 2>&1; "
+        f"docker run -d --name {container['name']} "
+        f"--hostname PublicHost "
+        f"--cpus=\"{cpu_limit}\" "
+        f"-m=\"{memory_limit}\" "
+        f"-p {container['port']}:8080 {_image_for(server)}"
+    )
+    try:
+        result = await ssh_pool.run(server, command)
+        if result.exit_status == 0:
+            return result.stdout.strip()
+        print(f"Ошибка Docker: {result.stderr}")
+    except Exception as e:
+        print(f"Ошибка SSH при переустановке контейнера: {e}")
+    return None
+
+async def get_container_limits(container, server):
+    """Текущие лимиты контейнера в формате тарифа ({"cpu_limit", "memory_limit"}) или None."""
+    container_docker_id = container.get('container_id') or container.get('id')
+    command = f"docker inspect --format '{{{{.HostConfig.NanoCpus}}}} {{{{.HostConfig.Memory}}}}' {container_docker_id}"
+    try:
+        result = await ssh_pool.run(server, command, retries=1)
+        if result.exit_status != 0:
+            return None
+        nano_cpus, memory = (int(value) for value in result.stdout.split())
+    except Exception:
+        return None
+    if not nano_cpus or not memory:
+        return None
+    return {"cpu_limit": str(nano_cpus / 1e9), "memory_limit": f"{memory // (1024 * 1024)}m"}
+
+async def create_stopped_container(server, host_port, container_name):
+    """
+    Создает (но не запускает) контейнер без лимитов для пула заготовок.
+    Возвращает docker id или None.
+    """
+    command = (
+        f"docker create --name {container_name} "
+        f"--hostname PublicHost "
+        f"-p {host_port}:8080 {_image_for(server)}"
+    )
+    try:
+        result = await ssh_pool.run(server, command)
+        if result.exit_status == 0:
+            return result.stdout.strip()
+        print(f"Ошибка Docker: {result.stderr}")
+    except Exception as e:
+        print(f"Ошибка SSH при создании заготовки контейнера: {e}")
+    return None
+
+async def activate_container(server, container_docker_id, tariff, new_name):
+    """
+    Превращает заготовку из пула в контейнер пользователя одной SSH-командой:
+    применяет лимиты тарифа, переименовывает и запускает.
+    """
+    cpu_limit, memory_limit = _tariff_limits(tariff)
+    # Как и `docker run -m`, разрешаем swap в размере лимита памяти
+    try:
+        memory_mb = float(memory_limit[:-1]) * (1024 if memory_limit.endswith('g') else 1)
+        memory_swap = f"{int(memory_mb * 2)}m"
+    except ValueError:
+        memory_swap = "-1"
+    command = (
+        f"docker update --cpus=\"{cpu_limit}\" --memory=\"{memory_limit}\" --memory-swap=\"{memory_swap}\" {container_docker_id} "
+        f"&& docker rename {container_docker_id} {new_name} "
+        f"&& docker start {container_docker_id}"
+    )
+    try:
+        result = await ssh_pool.run(server, command)
+        if result.exit_status == 0:
+            return True
+        print(f"Ошибка Docker: {result.stderr}")
+    except Exception as e:
+        print(f"Ошибка SSH при активации заготовки контейнера: {e}")
+    return False
+
+async def pull_image(server, image=DOCKER_IMAGE):
+    """
+    Скачивает образ на сервер и возвращает его digest ("repo@sha256:..."),
+    а для образов без реестра - id образа. None при ошибке.
+    """
+    command = (
+        f"docker pull -q {image} >/dev/null && "
+        f"docker image inspect --format '{{{{if .RepoDigests}}}}{{{{index .RepoDigests 0}}}}{{{{else}}}}{{{{.Id}}}}{{{{end}}}}' {image}"
+    )
+    try:
+        result = await ssh_pool.run(server, command, retries=1)
+    except Exception as e:
+        print(f"Ошибка SSH при загрузке образа на {server['ip']}: {e}")
+        return None
+    if result.exit_status != 0:
+        print(f"Ошибка Docker: {result.stderr}")
+        return None
+    return result.stdout.strip() or None
+
 # --- (Остальные функции файла без изменений) ---
+async def get_server_capacity(server):
+    """Реальные ресурсы сервера по данным `docker info`: {"cpu": ядер, "memory_mb": МБ} или None."""
+    command = "docker info --format '{{.NCPU}} {{.MemTotal}}'"
+    try:
+        result = await ssh_pool.run(server, command, retries=1)
+        if result.exit_status != 0:
+            print(f"Ошибка Docker: {result.stderr}")
+            return None
+        ncpu, mem_total = result.stdout.split()
+        return {"cpu": float(ncpu), "memory_mb": int(mem_total) // (1024 * 1024)}
+    except Exception as e:
+        print(f"Не удалось получить ресурсы сервера {server['ip']}: {e}")
+        return None
+
+async def get_listening_ports(server):
+    """Список TCP-портов, которые слушает сервер, или None при ошибке."""
+    command = "ss -Htln 2>/dev/null || netstat -tln"
+    try:
+        result = await ssh_pool.run(server, command, retries=1)
+    except Exception as e:
+        print(f"Не удалось получить список портов сервера {server['ip']}: {e}")
+        return None
+    if result.exit_status != 0:
+        return None
+
+    ports = set()
+    for line in result.stdout.splitlines():
+        columns = line.split()
+        # И у ss, и у netstat локальный адрес - четвёртая колонка
+        if len(columns) < 4 or ':' not in columns[3]:
+            continue
+        port = columns[3].rsplit(':', 1)[1]
+        if port.isdigit():
+            ports.add(int(port))
+    return sorted(ports)
+
 async def get_container_status(container, server):
     container_docker_id = container.get('container_id') or container.get('id')
     command = f"docker inspect --format='{{{{.State.Status}}}}' {container_docker_id}"
     try:
-        async with asyncssh.connect(
-            server["ip"], port=server["port"], username=server["user"],
-            password=server["pass"], known_hosts=None
-        ) as conn:
-            result = await conn.run(command)
-            return result.stdout.strip() if result.exit_status == 0 else "unknown"
+        result = await ssh_pool.run(server, command, retries=1)
+        return result.stdout.strip() if result.exit_status == 0 else "unknown"
     except Exception:
         return "error"
 
+def _parse_ps_state(entry: dict) -> str:
+    """Достаёт состояние контейнера из строки `docker ps --format '{{json .}}'`."""
+    if entry.get("State"):
+        return entry["State"]
+    # Старые версии Docker не отдают поле State, разбираем человекочитаемый Status
+    status = entry.get("Status", "")
+    if "(Paused)" in status:
+        return "paused"
+    for prefix, state in (("Up", "running"), ("Exited", "exited"), ("Created", "created"),
+                          ("Restarting", "restarting"), ("Removal", "removing"), ("Dead", "dead")):
+        if status.startswith(prefix):
+            return state
+    return "unknown"
+
+async def list_server_containers(server):
+    """
+    Возвращает состояние всех контейнеров хостинга на сервере одним вызовом `docker ps`.
+    Результат: {полный docker id или имя: статус}, либо None при ошибке SSH/Docker.
+    """
+    command = "docker ps -a --no-trunc --filter name=-Host- --format '{{json .}}'"
+    try:
+        result = await ssh_pool.run(server, command, retries=1)
+    except Exception as e:
+        print(f"Ошибка SSH при получении списка контейнеров с {server['ip']}: {e}")
+        return None
+    if result.exit_status != 0:
+        print(f"Ошибка Docker: {result.stderr}")
+        return None
+
+    states = {}
+    for line in result.stdout.splitlines():
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        state = _parse_ps_state(entry)
+        states[entry.get("ID", "")] = state
+        states[entry.get("Names", "")] = state
+    return states
+
+async def get_containers_status(containers: list) -> dict:
+    """
+    Пакетно получает статусы контейнеров: по одному `docker ps` на сервер, серверы опрашиваются параллельно.
+    Возвращает {id записи в БД: статус}. Контейнеры, которых нет на сервере, получают "unknown",
+    а контейнеры недоступного сервера - "error".
+    """
+    from config_loader import SERVERS
+
+    by_server = {}
+    for container in containers:
+        by_server.setdefault(container['server_index'], []).append(container)
+
+    server_indexes = list(by_server)
+    listings = await asyncio.gather(*(list_server_containers(SERVERS[index]) for index in server_indexes))
+
+    statuses = {}
+    for server_index, states in zip(server_indexes, listings):
+        for container in by_server[server_index]:
+            if states is None:
+                statuses[container['id']] = "error"
+                continue
+            docker_id = container.get('container_id', '')
+            statuses[container['id']] = states.get(docker_id) or states.get(container['name'], "unknown")
+    return statuses
+
+# События, которые меняют состояние контейнера
+_STATE_EVENTS = ("start", "restart", "die", "oom", "pause", "unpause", "destroy")
+
+async def stream_events(server, on_connected=None):
+    """
+    Асинхронный генератор событий контейнеров сервера из долгоживущего `docker events`.
+    После запуска потока вызывает on_connected() (например, для сверки пропущенного).
+    Завершается, когда поток обрывается.
+    """
+    filters = " ".join(f"--filter event={event}" for event in _STATE_EVENTS)
+    command = f"docker events --filter type=container {filters} --format '{{{{json .}}}}'"
+    async with ssh_pool.connection(server) as conn:
+        async with conn.create_process(command) as process:
+            if on_connected is not None:
+                await on_connected()
+            async for line in process.stdout:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+_SIZE_UNITS_MB = {"b": 1 / 1024 ** 2, "kib": 1 / 1024, "kb": 1 / 1024, "mib": 1, "mb": 1,
+                  "gib": 1024, "gb": 1024, "tib": 1024 ** 2, "tb": 1024 ** 2}
+
+def _parse_size_mb(value: str) -> float:
+    """Переводит размер из вывода `docker stats` ("12.5MiB", "1.2GiB") в мегабайты."""
+    number = value.rstrip(string.ascii_letters)
+    unit = value[len(number):].lower()
+    try:
+        return float(number) * _SIZE_UNITS_MB.get(unit, 0)
+    except ValueError:
+        return 0.0
+
+async def get_containers_stats(server):
+    """
+    Потребление ресурсов всеми запущенными контейнерами сервера за один вызов `docker stats`.
+    Возвращает {имя контейнера: {"cpu": % одного ядра, "memory_mb": МБ}} или None при ошибке.
+    """
+    command = "docker stats --no-stream --format '{{json .}}'"
+    try:
+        result = await ssh_pool.run(server, command, retries=1)
+    except Exception as e:
+        print(f"Ошибка SSH при получении статистики с {server['ip']}: {e}")
+        return None
+    if result.exit_status != 0:
+        print(f"Ошибка Docker: {result.stderr}")
+        return None
+
+    stats = {}
+    for line in result.stdout.splitlines():
+        try:
+            entry = json.loads(line)
+            cpu = float(entry.get("CPUPerc", "0").rstrip("%") or 0)
+        except (json.JSONDecodeError, ValueError):
+            continue
+        memory_used = entry.get("MemUsage", "").split("/")[0].strip()
+        stats[entry.get("Name", "")] = {"cpu": cpu, "memory_mb": _parse_size_mb(memory_used)}
+    return stats
+
 async def stop_container(container, server):
     container_docker_id = container.get('container_id') or container.get('id')
     command = f"docker stop {container_docker_id}"
     try:
-        async with asyncssh.connect(
-            server["ip"], port=server["port"], username=server["user"],
-            password=server["pass"], known_hosts=None
-        ) as conn:
-            await conn.run(command)
-            return True
+        await ssh_pool.run(server, command)
+        return True
     except Exception:
         return False
 
@@ -95,24 +363,56 @@ async def start_container(container, server):
     container_docker_id = container.get('container_id') or container.get('id')
     command = f"docker start {container_docker_id}"
     try:
-        async with asyncssh.connect(
-            server["ip"], port=server["port"], username=server["user"],
-            password=server["pass"], known_hosts=None
-        ) as conn:
-            await conn.run(command)
-            return True
+        await ssh_pool.run(server, command)
+        return True
     except Exception:
         return False
 
+async def _bulk_command(server, verb, container_docker_ids, chunk_size=200):
+    """Выполняет `docker <verb> id1 id2 ...` пачками вместо отдельной команды на каждый контейнер."""
+    success = True
+    for start in range(0, len(container_docker_ids), chunk_size):
+        chunk = " ".join(container_docker_ids[start:start + chunk_size])
+        try:
+            result = await ssh_pool.run(server, f"docker {verb} {chunk}")
+            if result.exit_status != 0:
+                print(f"Ошибка Docker: {result.stderr}")
+                success = False
+        except Exception as e:
+            print(f"Ошибка SSH при выполнении docker {verb} на {server['ip']}: {e}")
+            success = False
+    return success
+
+async def stop_containers(server, container_docker_ids):
+    return await _bulk_command(server, "stop", container_docker_ids)
+
+async def start_containers(server, container_docker_ids):
+    return await _bulk_command(server, "start", container_docker_ids)
+
 async def delete_container(container, server):
     container_docker_id = container.get('container_id') or container.get('id')
     command = f"docker rm -f {container_docker_id}"
     try:
-        async with asyncssh.connect(
-            server["ip"], port=server["port"], username=server["user"],
-            password=server["pass"], known_hosts=None
-        ) as conn:
-            await conn.run(command)
-            return True
+        await ssh_pool.run(server, command)
+        return True
     except Exception:
-        return False
\ No newline at end of file
+        return False
+
+# --- Выбор бэкенда ---
+# При docker_backend = "api" операции с Docker идут через Engine API (services/docker_api.py),
+# а не через CLI. get_listening_ports к Docker не относится и всегда работает через shell.
+if DOCKER_BACKEND == "api":
+    from services import docker_api
+
+    create_container = docker_api.create_container
+    create_stopped_container = docker_api.create_stopped_container
+    activate_container = docker_api.activate_container
+    recreate_container = docker_api.recreate_container
+    get_container_limits = docker_api.get_container_limits
+    get_container_status = docker_api.get_container_status
+    list_server_containers = docker_api.list_server_containers
+    stop_container = docker_api.stop_container
+    start_container = docker_api.start_container
+    delete_container = docker_api.delete_container
+    get_server_capacity = docker_api.get_server_capacity
+    pull_image = docker_api.pull_image
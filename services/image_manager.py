@@ -0,0 +1,69 @@
+# services/image_manager.py
+import asyncio
+import collections
+import logging
+
+from config_loader import SERVERS, DOCKER_IMAGE, IMAGE_SYNC
+from services import docker_manager, warm_pool
+from utils import database as db
+
+PULL_INTERVAL = IMAGE_SYNC.get("pull_interval", 3600)
+
+
+async def load_pins():
+    """Закрепляет за серверами digest'ы, сохранённые в БД при прошлых запусках."""
+    for server_index, image in (await db.get_server_images()).items():
+        if server_index < len(SERVERS):
+            docker_manager.pin_image(server_index, image['digest'])
+
+async def _pull(server_index: int, server: dict):
+    digest = await docker_manager.pull_image(server, DOCKER_IMAGE)
+    if digest is None:
+        logging.warning(f"Не удалось скачать {DOCKER_IMAGE} на сервер {server['ip']}")
+        return None
+
+    previous = (await db.get_server_images()).get(server_index)
+    await db.set_server_image(server_index, digest)
+    docker_manager.pin_image(server_index, digest)
+    if previous and previous['digest'] != digest:
+        logging.info(f"Сервер {server['ip']}: образ обновлён до {digest}")
+        # Заготовки созданы из старого образа - пересоздаём их
+        await warm_pool.flush(server_index)
+    return digest
+
+async def pull_all() -> dict:
+    """Параллельно скачивает образ на все серверы. Возвращает {server_index: digest или None}."""
+    digests = await asyncio.gather(*(_pull(index, server) for index, server in enumerate(SERVERS)))
+    return dict(enumerate(digests))
+
+async def get_images_report() -> tuple[str | None, list]:
+    """
+    Состояние образа на серверах для админ-панели.
+    Возвращает (эталонный digest - тот, что стоит на большинстве серверов; список серверов),
+    где у каждого сервера есть digest, pulled_at и признак drift.
+    """
+    images = await db.get_server_images()
+    counter = collections.Counter(image['digest'] for image in images.values())
+    reference = counter.most_common(1)[0][0] if counter else None
+
+    report = []
+    for index, server in enumerate(SERVERS):
+        image = images.get(index)
+        report.append({
+            "server_index": index,
+            "ip": server["ip"],
+            "digest": image['digest'] if image else None,
+            "pulled_at": image['pulled_at'] if image else None,
+            "drift": image is None or image['digest'] != reference,
+        })
+    return reference, report
+
+async def run_image_manager(interval: int = PULL_INTERVAL):
+    """Фоновая задача: держит образ на всех серверах актуальным."""
+    await load_pins()
+    while True:
+        try:
+            await pull_all()
+        except Exception as e:
+            logging.error(f"Ошибка обновления образа на серверах: {e}")
+        await asyncio.sleep(interval)
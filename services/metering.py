@@ -0,0 +1,52 @@
+# services/metering.py
+import asyncio
+import logging
+import time
+
+from config_loader import SERVERS, METERING
+from services import docker_manager
+from utils import database as db
+
+INTERVAL = METERING.get("interval", 60)
+RAW_RETENTION = METERING.get("raw_retention_hours", 24) * 3600
+ROLLUP_RETENTION = METERING.get("rollup_retention_days", 30) * 86400
+
+
+async def _collect_server(server_index: int, containers: list):
+    stats = await docker_manager.get_containers_stats(SERVERS[server_index])
+    if stats is None:
+        return
+    samples = [
+        (container['id'], stats[container['name']]['cpu'], stats[container['name']]['memory_mb'])
+        for container in containers if container['name'] in stats
+    ]
+    await db.add_metrics(server_index, int(time.time()), samples)
+
+async def collect_once():
+    """Один замер: по одному `docker stats` на сервер, серверы опрашиваются параллельно."""
+    by_server = {index: [] for index in range(len(SERVERS))}
+    for container in await db.get_all_containers_info():
+        if container['server_index'] in by_server:
+            by_server[container['server_index']].append(container)
+
+    await asyncio.gather(*(_collect_server(index, containers) for index, containers in by_server.items()))
+    await db.rollup_and_prune_metrics(RAW_RETENTION, ROLLUP_RETENTION)
+
+async def run_metering(interval: int = INTERVAL):
+    """Фоновая задача сбора метрик потребления ресурсов."""
+    if interval <= 0:
+        return
+    while True:
+        try:
+            await collect_once()
+        except Exception as e:
+            logging.error(f"Ошибка сбора метрик контейнеров: {e}")
+        await asyncio.sleep(interval)
+
+async def get_container_usage(container: dict) -> dict | None:
+    """Потребление контейнера для экрана управления: последний замер и среднее за час (если замер свежий)."""
+    now = int(time.time())
+    usage = await db.get_container_usage(container['id'], now - 3600)
+    if usage is None or now - usage['ts'] > max(INTERVAL, 1) * 3:
+        return None
+    return usage
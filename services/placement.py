@@ -0,0 +1,152 @@
+# services/placement.py
+import asyncio
+import contextlib
+import time
+
+from config_loader import SERVERS, PLACEMENT
+from services import docker_manager
+from utils import database as db
+
+STRATEGY = PLACEMENT.get("strategy", "least_loaded")
+CPU_OVERCOMMIT = PLACEMENT.get("cpu_overcommit", 1.0)
+MEMORY_OVERCOMMIT = PLACEMENT.get("memory_overcommit", 1.0)
+CAPACITY_TTL = PLACEMENT.get("capacity_ttl", 3600)
+# Недоступный сервер не опрашивается снова раньше, чем через столько секунд
+CAPACITY_RETRY = PLACEMENT.get("capacity_retry", 60)
+
+# Кэш реальных ресурсов серверов: {server_index: (время замера, {"cpu": ..., "memory_mb": ...} или None)}
+_capacity_cache: dict[int, tuple[float, dict | None]] = {}
+# Ресурсы, зарезервированные покупками, которые ещё не попали в таблицу containers
+_in_flight: dict[int, dict] = {}
+_lock = asyncio.Lock()
+
+
+def parse_cpu(value) -> float:
+    try:
+        cpu = float(value)
+        return cpu if cpu > 0 else 0.5
+    except (ValueError, TypeError):
+        return 0.5
+
+def parse_memory_mb(value) -> int:
+    """Переводит лимит памяти в формате Docker ("256m", "1g") в мегабайты."""
+    try:
+        value = str(value).lower()
+        if value.endswith('g'):
+            return int(float(value[:-1]) * 1024)
+        if value.endswith('m'):
+            return int(float(value[:-1]))
+    except ValueError:
+        pass
+    return 256
+
+async def get_capacity(server_index: int) -> dict | None:
+    cached = _capacity_cache.get(server_index)
+    if cached and time.monotonic() - cached[0] < (CAPACITY_TTL if cached[1] is not None else CAPACITY_RETRY):
+        return cached[1]
+    capacity = await docker_manager.get_server_capacity(SERVERS[server_index])
+    _capacity_cache[server_index] = (time.monotonic(), capacity)
+    return capacity
+
+async def _get_capacities() -> list:
+    return await asyncio.gather(*(get_capacity(index) for index in range(len(SERVERS))))
+
+async def get_servers_load() -> list:
+    """
+    Загрузка каждого сервера: реальные ресурсы (с учётом коэффициентов переподписки)
+    и ресурсы, уже выделенные тарифам. Недоступные серверы пропускаются.
+    """
+    return _servers_load(await _get_capacities(), await db.get_server_allocations())
+
+def _servers_load(capacities: list, allocations: list) -> list:
+    allocated = {index: {"cpu": 0.0, "memory_mb": 0, "containers": 0} for index in range(len(SERVERS))}
+    for row in allocations:
+        usage = allocated.get(row['server_index'])
+        if usage is None:
+            continue
+        usage["cpu"] += parse_cpu(row['cpu_limit']) * row['containers']
+        usage["memory_mb"] += parse_memory_mb(row['memory_limit']) * row['containers']
+        usage["containers"] += row['containers']
+    for index, reserved in _in_flight.items():
+        allocated[index]["cpu"] += reserved["cpu"]
+        allocated[index]["memory_mb"] += reserved["memory_mb"]
+        allocated[index]["containers"] += reserved["containers"]
+
+    servers = []
+    for index, capacity in enumerate(capacities):
+        if capacity is None:
+            continue
+        servers.append({
+            "server_index": index,
+            "cpu_total": capacity["cpu"] * CPU_OVERCOMMIT,
+            "memory_mb_total": capacity["memory_mb"] * MEMORY_OVERCOMMIT,
+            "cpu_used": allocated[index]["cpu"],
+            "memory_mb_used": allocated[index]["memory_mb"],
+            "containers": allocated[index]["containers"],
+        })
+    return servers
+
+# --- Стратегии размещения: получают подходящие серверы и запрос, возвращают выбранный ---
+
+def _utilization(server: dict, cpu: float = 0.0, memory_mb: int = 0) -> float:
+    """Загрузка сервера по самому дефицитному ресурсу (0..1) после размещения запроса."""
+    return max((server["cpu_used"] + cpu) / server["cpu_total"],
+               (server["memory_mb_used"] + memory_mb) / server["memory_mb_total"])
+
+def bin_packing(servers: list, cpu: float, memory_mb: int) -> dict:
+    """Самый заполненный из подходящих серверов: освобождает целые серверы под крупные тарифы."""
+    return max(servers, key=lambda server: _utilization(server, cpu, memory_mb))
+
+def spread(servers: list, cpu: float, memory_mb: int) -> dict:
+    """Сервер с наименьшим числом контейнеров."""
+    return min(servers, key=lambda server: server["containers"])
+
+def least_loaded(servers: list, cpu: float, memory_mb: int) -> dict:
+    """Сервер с наименьшей загрузкой по самому дефицитному ресурсу."""
+    return min(servers, key=lambda server: _utilization(server))
+
+STRATEGIES = {
+    "bin_packing": bin_packing,
+    "spread": spread,
+    "least_loaded": least_loaded,
+}
+
+async def choose_server(tariff: dict) -> int | None:
+    """Возвращает индекс сервера для тарифа по выбранной стратегии или None, если места нигде нет."""
+    return _choose(await get_servers_load(), tariff)
+
+def _choose(servers: list, tariff: dict) -> int | None:
+    cpu, memory_mb = parse_cpu(tariff.get("cpu_limit")), parse_memory_mb(tariff.get("memory_limit"))
+    fitting = [
+        server for server in servers
+        if server["cpu_used"] + cpu <= server["cpu_total"]
+        and server["memory_mb_used"] + memory_mb <= server["memory_mb_total"]
+    ]
+    if not fitting:
+        return None
+    return STRATEGIES.get(STRATEGY, least_loaded)(fitting, cpu, memory_mb)["server_index"]
+
+@contextlib.asynccontextmanager
+async def reserve(tariff: dict):
+    """
+    Выбирает сервер и резервирует на нём ресурсы тарифа до выхода из блока,
+    чтобы параллельные покупки не заняли одно и то же место. Отдаёт индекс сервера или None.
+    """
+    # Замеры по SSH - до блокировки: медленный или недоступный сервер не должен задерживать все покупки
+    capacities = await _get_capacities()
+    async with _lock:
+        # Под блокировкой только чтение выделенных ресурсов из локальной БД и выбор в памяти
+        server_index = _choose(_servers_load(capacities, await db.get_server_allocations()), tariff)
+        if server_index is not None:
+            reserved = _in_flight.setdefault(server_index, {"cpu": 0.0, "memory_mb": 0, "containers": 0})
+            reserved["cpu"] += parse_cpu(tariff.get("cpu_limit"))
+            reserved["memory_mb"] += parse_memory_mb(tariff.get("memory_limit"))
+            reserved["containers"] += 1
+    try:
+        yield server_index
+    finally:
+        if server_index is not None:
+            reserved = _in_flight[server_index]
+            reserved["cpu"] -= parse_cpu(tariff.get("cpu_limit"))
+            reserved["memory_mb"] -= parse_memory_mb(tariff.get("memory_limit"))
+            reserved["containers"] -= 1
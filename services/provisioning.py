@@ -0,0 +1,289 @@
+# services/provisioning.py
+import asyncio
+import contextlib
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from config_loader import SERVERS, PROVISIONING
+from keyboards import inline
+from services import allocator, docker_manager, warm_pool
+from utils import database as db
+from utils import workers
+from utils.texts import texts
+
+WORKERS_PER_SERVER = PROVISIONING.get("workers_per_server", 2)
+MAX_ATTEMPTS = PROVISIONING.get("max_attempts", 3)
+RETRY_DELAY = PROVISIONING.get("retry_delay", 10)
+POLL_INTERVAL = PROVISIONING.get("poll_interval", 5)
+# В режиме нескольких воркеров задачи ставят все процессы, а выполняет только лидер:
+# он проверяет появление новых задач в БД с этим интервалом (секунды)
+WAKEUP_INTERVAL = PROVISIONING.get("wakeup_interval", 0.5)
+
+
+class JobFailed(Exception):
+    """Шаг задачи не удался; задача будет повторена или завершится ошибкой после последней попытки."""
+
+
+class ProvisioningQueue:
+    """
+    Очередь задач create/delete/reinstall, хранящаяся в таблице jobs.
+    На каждый сервер запускается свой пул воркеров, поэтому всплеск покупок
+    не перегружает один Docker-хост, а хендлеры Telegram не ждут завершения `docker run`.
+    """
+
+    def __init__(self):
+        self.bot: Bot | None = None
+        self._wakeups: dict[int, asyncio.Event] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, bot: Bot):
+        self.bot = bot
+        resumed = await db.requeue_running_jobs()
+        if resumed:
+            logging.info(f"Провижининг: возвращено в очередь {resumed} прерванных задач")
+        for server_index in range(len(SERVERS)):
+            self._wakeups[server_index] = asyncio.Event()
+            for _ in range(WORKERS_PER_SERVER):
+                self._tasks.append(asyncio.create_task(self._worker(server_index)))
+        if workers.ENABLED:
+            self._tasks.append(asyncio.create_task(self._watch_pending()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks.clear()
+
+    async def enqueue(self, kind: str, user_id: int, server_index: int, payload: dict,
+                      chat_id: int | None = None, message_id: int | None = None) -> int:
+        """Сохраняет задачу в БД и будит воркеры сервера. Возвращает id задачи."""
+        job_id = await db.create_job(kind, user_id, server_index, payload, chat_id, message_id)
+        self.wake(server_index)
+        return job_id
+
+    def wake(self, server_index: int):
+        """Будит воркеры сервера, чтобы задача, уже записанная в БД, не ждала очередного опроса."""
+        wakeup = self._wakeups.get(server_index)
+        if wakeup is not None:
+            wakeup.set()
+
+    async def _watch_pending(self):
+        """Будит воркеры серверов, на которых другие процессы поставили задачи: enqueue там никого не будит."""
+        while True:
+            try:
+                for server_index in await db.get_ready_job_servers():
+                    self.wake(server_index)
+            except Exception as e:
+                logging.error(f"Провижининг: не удалось проверить очередь: {e}")
+            await asyncio.sleep(WAKEUP_INTERVAL)
+
+    async def _worker(self, server_index: int):
+        wakeup = self._wakeups[server_index]
+        while True:
+            try:
+                job = await db.claim_job(server_index)
+            except Exception as e:
+                logging.error(f"Провижининг: не удалось получить задачу: {e}")
+                job = None
+
+            if job is None:
+                wakeup.clear()
+                # Периодический опрос подхватывает отложенные повторы и задачи из других процессов
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(wakeup.wait(), POLL_INTERVAL)
+                continue
+
+            await self._run_job(job)
+
+    async def _run_job(self, job: dict):
+        handler = getattr(self, f"_handle_{job['kind']}", None)
+        if handler is None:
+            await db.finish_job(job['id'], 'failed', f"unknown job kind: {job['kind']}")
+            return
+        try:
+            await handler(job)
+            await db.finish_job(job['id'], 'done')
+        except JobFailed as e:
+            await self._fail_or_retry(job, str(e))
+        except Exception as e:
+            logging.exception(f"Провижининг: задача #{job['id']} упала")
+            await self._fail_or_retry(job, f"{type(e).__name__}: {e}")
+
+    async def _fail_or_retry(self, job: dict, error: str):
+        if job['attempts'] < MAX_ATTEMPTS:
+            delay = RETRY_DELAY * 2 ** (job['attempts'] - 1)
+            await db.reschedule_job(job['id'], delay, error)
+            await self._notify(job, texts.get("provisioning.retrying", attempt=job['attempts'], delay=delay))
+            return
+
+        await db.finish_job(job['id'], 'failed', error)
+        on_failure = getattr(self, f"_on_{job['kind']}_failed", None)
+        if on_failure is not None:
+            await on_failure(job)
+
+    async def _notify(self, job: dict, text: str, reply_markup=None):
+        """Показывает пользователю ход выполнения, редактируя сообщение, из которого была поставлена задача."""
+        if not self.bot or not job.get('chat_id'):
+            return
+        chat_id, message_id = job['chat_id'], job['message_id']
+        try:
+            try:
+                await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id,
+                                                 parse_mode="HTML", reply_markup=reply_markup)
+            except TelegramBadRequest as e:
+                if "message is not modified" in str(e):
+                    return
+                # Сообщение с баннером: текст хранится в подписи к фото
+                try:
+                    await self.bot.edit_message_caption(caption=text, chat_id=chat_id, message_id=message_id,
+                                                        parse_mode="HTML", reply_markup=reply_markup)
+                except TelegramBadRequest:
+                    await self.bot.send_message(chat_id, text, parse_mode="HTML", reply_markup=reply_markup)
+        except Exception as e:
+            logging.warning(f"Провижининг: не удалось уведомить {chat_id}: {e}")
+
+    # --- Шаги задач ---
+
+    async def _create_from_payload(self, job: dict) -> tuple[dict, int]:
+        """
+        Резервирует порт и имя (один раз за задачу) и создает контейнер.
+        Возвращает (данные контейнера, id записи в БД).
+        """
+        payload = job['payload']
+        server_index, server = job['server_index'], SERVERS[job['server_index']]
+
+        if 'host_port' not in payload:
+            allocated = await allocator.allocate(server_index, job['user_id'])
+            if allocated is None:
+                raise JobFailed("no free ports")
+            payload['host_port'], payload['container_name'] = allocated
+            await db.save_job_payload(job['id'], payload)
+        elif job['attempts'] > 1:
+            # Предыдущая попытка могла успеть создать контейнер с этим именем - убираем его
+            await docker_manager.delete_container({'id': payload['container_name']}, server)
+
+        container_info = await docker_manager.create_container(
+            job['user_id'], server, payload['tariff'], payload['host_port'], payload['container_name']
+        )
+        if not container_info:
+            raise JobFailed("docker run failed")
+        container_db_id = await db.add_container(job['user_id'], container_info)
+        payload['container_db_id'] = container_db_id
+        await db.save_job_payload(job['id'], payload)
+        return container_info, container_db_id
+
+    async def _claim_warm(self, job: dict) -> dict | None:
+        """Пробует выдать заготовку из пула (только на первой попытке). Возвращает данные контейнера или None."""
+        payload = job['payload']
+        if 'host_port' in payload:
+            return None
+        container_info = await warm_pool.claim(job['server_index'], job['user_id'], payload['tariff'])
+        if container_info is None:
+            return None
+        # Порт и имя теперь принадлежат задаче: при повторе контейнер будет пересоздан на них же
+        payload['host_port'], payload['container_name'] = container_info['port'], container_info['name']
+        await db.save_job_payload(job['id'], payload)
+        payload['container_db_id'] = await db.add_container(job['user_id'], container_info)
+        await db.save_job_payload(job['id'], payload)
+        return container_info
+
+    async def _find_created(self, job: dict) -> tuple[bool, dict | None]:
+        """
+        Проверяет, не успела ли прерванная попытка задачи создать контейнер и записать его в БД.
+        Возвращает (записан ли уже, запись или None, если её успели удалить).
+        """
+        payload = job['payload']
+        if 'container_db_id' in payload:
+            return True, await db.get_container_by_db_id(payload['container_db_id'])
+        if 'container_name' in payload:
+            container = await db.get_container_by_name(job['server_index'], payload['container_name'])
+            # Имя с тем же портом могло достаться другому пользователю после удаления контейнера
+            if container is not None and container['user_id'] == job['user_id']:
+                return True, container
+        return False, None
+
+    async def _handle_create(self, job: dict):
+        created, container_info = await self._find_created(job)
+        if created:
+            # Контейнер уже принадлежит пользователю: повтор не должен удалять его и добавлять вторую запись
+            if container_info is not None:
+                await self._notify_created(job, container_info)
+            return
+
+        await self._notify(job, texts.get("purchase.creating_container"))
+        container_info = await self._claim_warm(job)
+        if container_info is None:
+            container_info, _ = await self._create_from_payload(job)
+        await self._notify_created(job, container_info)
+
+    async def _notify_created(self, job: dict, container_info: dict):
+        user = await db.get_or_create_user(job['user_id'])
+        await self._notify(
+            job,
+            texts.get("purchase.creation_success", server_ip=container_info['server_ip'], port=container_info['port']),
+            inline.main_menu_keyboard(user_role=user.get('role'))
+        )
+
+    async def _on_create_failed(self, job: dict):
+        payload = job['payload']
+        if 'host_port' in payload:
+            await allocator.release(job['server_index'], payload['host_port'])
+        await db.add_transaction(job['user_id'], payload['price'], "refund", f"refund:job:{job['id']}")
+        await self._notify(job, texts.get("purchase.creation_error"))
+
+    async def _handle_delete(self, job: dict):
+        container = await db.get_container_by_db_id(job['payload']['container_db_id'])
+        if container:
+            if not await docker_manager.delete_container(container, SERVERS[container['server_index']]):
+                raise JobFailed("docker rm failed")
+            await db.delete_container_by_db_id(container['id'])
+        user_containers = await db.get_user_containers(job['user_id'])
+        await self._notify(job, texts.get("management.delete_success"),
+                           inline.my_userbots_keyboard(user_containers))
+
+    async def _on_delete_failed(self, job: dict):
+        await self._notify(job, texts.get("management.delete_error"))
+
+    async def _reinstall_tariff(self, container: dict, server: dict) -> dict:
+        """Тариф контейнера; для старых записей без tariff_id - его текущие лимиты на сервере."""
+        tariff = await db.get_tariff_by_id(container['tariff_id']) if container.get('tariff_id') else None
+        if tariff is None:
+            tariff = await docker_manager.get_container_limits(container, server)
+        if tariff is None:
+            raise JobFailed("container tariff is unknown")
+        return tariff
+
+    async def _handle_reinstall(self, job: dict):
+        # Контейнер пересоздаётся на месте: имя, порт (адрес консоли) и запись в БД сохраняются,
+        # поэтому повтор задачи просто выполняет ту же команду ещё раз с сохранёнными лимитами
+        container = await db.get_container_by_db_id(job['payload']['container_db_id'])
+        if container is None:
+            await self._notify(job, texts.get("management.container_not_found"))
+            return
+        server = SERVERS[container['server_index']]
+        payload = job['payload']
+        if 'tariff' not in payload:
+            # Лимиты определяются до первого `docker rm -f`: после него старый контейнер уже не проинспектировать,
+            # поэтому повторы берут их из задачи
+            payload['tariff'] = await self._reinstall_tariff(container, server)
+            await db.save_job_payload(job['id'], payload)
+        tariff = payload['tariff']
+
+        new_docker_id = await docker_manager.recreate_container(server, container, tariff)
+        if not new_docker_id:
+            raise JobFailed("docker run failed")
+        await db.update_reinstalled_container(container['id'], new_docker_id)
+        container.update(container_id=new_docker_id, status="running")
+        await self._notify(job, texts.get("management.reinstall_success"),
+                           inline.management_keyboard(container, container['id']))
+
+    async def _on_reinstall_failed(self, job: dict):
+        await self._notify(job, texts.get("management.reinstall_create_error"))
+
+
+# Единая очередь, которая используется во всем боте
+provisioning_queue = ProvisioningQueue()
@@ -0,0 +1,181 @@
+# services/ssh_pool.py
+import asyncio
+import contextlib
+import logging
+import time
+
+import asyncssh
+
+from config_loader import SSH_POOL
+
+# Ошибки, после которых соединение считается мёртвым и подлежит замене.
+# ChannelOpenError сюда не входит: сервер лишь отказал в новом канале, само соединение исправно
+CONNECTION_ERRORS = (
+    asyncssh.ConnectionLost,
+    asyncssh.DisconnectError,
+    ConnectionError,
+    OSError,
+)
+
+
+class _PooledConnection:
+    """Аутентифицированное SSH-соединение и число открытых на нём каналов."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.sessions = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def is_closed(self) -> bool:
+        return self.conn.is_closed()
+
+
+class SSHConnectionPool:
+    """
+    Пул долгоживущих SSH-соединений, сгруппированных по серверу.
+    Команды выполняются как отдельные каналы поверх уже открытого соединения,
+    поэтому рукопожатие и авторизация происходят один раз, а не на каждое нажатие кнопки.
+    """
+
+    def __init__(self, max_sessions_per_connection: int = 10, max_connections_per_server: int = 4,
+                 idle_timeout: float = 300, keepalive_interval: float = 30,
+                 keepalive_count_max: int = 3, connect_timeout: float = 15):
+        self.max_sessions = max_sessions_per_connection
+        self.max_connections = max_connections_per_server
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count_max = keepalive_count_max
+        self.connect_timeout = connect_timeout
+
+        self._connections: dict[tuple, list[_PooledConnection]] = {}
+        self._conditions: dict[tuple, asyncio.Condition] = {}
+        # Соединения, которые сейчас устанавливаются: место в пуле за ними уже зарезервировано
+        self._connecting: dict[tuple, int] = {}
+        self._reaper_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(server: dict) -> tuple:
+        return server["ip"], server["port"], server["user"]
+
+    async def _connect(self, server: dict):
+        logging.info(f"SSH: открываю новое соединение с {server['ip']}:{server['port']}")
+        return await asyncssh.connect(
+            server["ip"], port=server["port"], username=server["user"],
+            password=server["pass"], known_hosts=None,
+            keepalive_interval=self.keepalive_interval,
+            keepalive_count_max=self.keepalive_count_max,
+            connect_timeout=self.connect_timeout,
+        )
+
+    async def _acquire(self, server: dict) -> _PooledConnection:
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_idle_connections())
+
+        key = self._key(server)
+        condition = self._conditions.setdefault(key, asyncio.Condition())
+        async with condition:
+            while True:
+                pool = self._connections.setdefault(key, [])
+                pool[:] = [pooled for pooled in pool if not pooled.is_closed]
+
+                # Берём наименее загруженное соединение, на котором есть свободный канал
+                free = [pooled for pooled in pool if pooled.sessions < self.max_sessions]
+                if free:
+                    pooled = min(free, key=lambda item: item.sessions)
+                    pooled.sessions += 1
+                    return pooled
+                if len(pool) + self._connecting.get(key, 0) < self.max_connections:
+                    self._connecting[key] = self._connecting.get(key, 0) + 1
+                    break
+                await condition.wait()
+
+        # Подключение (до connect_timeout секунд) идёт без блокировки, чтобы остальные запросы
+        # к серверу могли пользоваться уже открытыми соединениями
+        try:
+            conn = await self._connect(server)
+        except BaseException:
+            async with condition:
+                self._connecting[key] -= 1
+                condition.notify_all()
+            raise
+
+        async with condition:
+            self._connecting[key] -= 1
+            pooled = _PooledConnection(conn)
+            pooled.sessions = 1
+            self._connections.setdefault(key, []).append(pooled)
+            # У нового соединения есть свободные каналы для тех, кто ждёт
+            condition.notify_all()
+        return pooled
+
+    async def _release(self, server: dict, pooled: _PooledConnection):
+        condition = self._conditions[self._key(server)]
+        async with condition:
+            pooled.sessions -= 1
+            pooled.last_used = time.monotonic()
+            condition.notify()
+
+    @contextlib.asynccontextmanager
+    async def connection(self, server: dict):
+        """
+        Выдаёт соединение из пула, занимая на нём один канал на время блока.
+        Если внутри блока соединение оборвалось, оно закрывается и больше не выдаётся.
+        """
+        pooled = await self._acquire(server)
+        try:
+            yield pooled.conn
+        except CONNECTION_ERRORS:
+            pooled.conn.close()
+            raise
+        finally:
+            await self._release(server, pooled)
+
+    async def run(self, server: dict, command: str, retries: int = 0):
+        """
+        Выполняет команду на сервере через пул.
+        При обрыве соединения переподключается и повторяет команду до `retries` раз.
+        Повтор включается только для команд, которые безопасно выполнить дважды (чтение состояния):
+        `docker run` или `docker rm -f` могли успеть выполниться до обрыва.
+        """
+        for attempt in range(retries + 1):
+            try:
+                async with self.connection(server) as conn:
+                    return await conn.run(command)
+            except CONNECTION_ERRORS as e:
+                if attempt == retries:
+                    raise
+                logging.warning(f"SSH: соединение с {server['ip']} потеряно ({e}), переподключаюсь...")
+
+    async def _reap_idle_connections(self):
+        """Фоновая задача: закрывает соединения, простаивающие дольше idle_timeout."""
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            now = time.monotonic()
+            # Копия: пока ждём блокировку, _acquire может добавить новый сервер
+            for key, pool in list(self._connections.items()):
+                async with self._conditions[key]:
+                    for pooled in list(pool):
+                        if pooled.sessions == 0 and now - pooled.last_used > self.idle_timeout:
+                            logging.info(f"SSH: закрываю простаивающее соединение с {key[0]}:{key[1]}")
+                            pooled.conn.close()
+                            pool.remove(pooled)
+
+    async def close_all(self):
+        """Закрывает все соединения пула. Вызывается при остановке бота."""
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reaper_task
+            self._reaper_task = None
+
+        for pool in self._connections.values():
+            for pooled in pool:
+                pooled.conn.close()
+                with contextlib.suppress(Exception):
+                    await pooled.conn.wait_closed()
+            pool.clear()
+
+
+# Единый пул, который используется во всем боте
+ssh_pool = SSHConnectionPool(**SSH_POOL)
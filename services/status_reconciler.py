@@ -0,0 +1,72 @@
+# services/status_reconciler.py
+import asyncio
+import logging
+import time
+
+from config_loader import STATUS_POLL_INTERVAL, STATUS_STALE_AFTER
+from services import docker_manager
+from utils import database as db
+
+
+def status_age(container: dict) -> int:
+    """Сколько секунд назад был получен сохранённый статус контейнера."""
+    return int(time.time()) - (container.get('status_updated_at') or 0)
+
+def format_status_age(container: dict) -> str:
+    age = status_age(container)
+    if age < 60:
+        return f"{age} сек."
+    if age < 3600:
+        return f"{age // 60} мин."
+    return f"{age // 3600} ч."
+
+async def apply_heartbeats(containers: list):
+    """
+    Пока поток событий сервера жив (свежий пульс в БД), статусы его контейнеров актуальны
+    на момент пульса: время статуса подставляется в словари контейнеров, в БД ничего не пишется.
+    """
+    heartbeats = await db.get_server_heartbeats()
+    if not heartbeats:
+        return
+    now = int(time.time())
+    for container in containers:
+        heartbeat = heartbeats.get(container['server_index'])
+        if heartbeat and now - heartbeat <= STATUS_STALE_AFTER:
+            container['status_updated_at'] = max(container.get('status_updated_at') or 0, heartbeat)
+
+async def refresh_statuses(containers: list, only_stale: bool = True):
+    """
+    Обновляет статусы переданных контейнеров (по умолчанию - только устаревших)
+    одним запросом на сервер, сохраняет их в БД и подставляет в словари контейнеров.
+    """
+    if only_stale:
+        await apply_heartbeats(containers)
+        containers = [c for c in containers if status_age(c) > STATUS_STALE_AFTER]
+    if not containers:
+        return
+
+    statuses = await docker_manager.get_containers_status(containers)
+    fresh = {db_id: status for db_id, status in statuses.items() if status != 'error'}
+    if not fresh:
+        return
+    await db.update_container_statuses(fresh)
+
+    now = int(time.time())
+    for container in containers:
+        if container['id'] in fresh:
+            container['status'] = fresh[container['id']]
+            container['status_updated_at'] = now
+
+async def reconcile_once():
+    """Один проход: опрашивает все серверы параллельно и сохраняет статусы всех контейнеров."""
+    containers = await db.get_all_containers_info()
+    await refresh_statuses(containers, only_stale=False)
+
+async def run_status_reconciler(interval: float = STATUS_POLL_INTERVAL):
+    """Фоновая задача, поддерживающая кэш статусов в таблице containers в актуальном состоянии."""
+    while True:
+        try:
+            await reconcile_once()
+        except Exception as e:
+            logging.error(f"Ошибка фонового обновления статусов: {e}")
+        await asyncio.sleep(interval)
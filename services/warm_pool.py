@@ -0,0 +1,87 @@
+# services/warm_pool.py
+import asyncio
+import logging
+
+from config_loader import SERVERS, WARM_POOL
+from services import allocator, docker_manager
+from utils import database as db
+
+SIZE_PER_SERVER = WARM_POOL.get("size_per_server", 2)
+INTERVAL = WARM_POOL.get("interval", 30)
+
+
+async def _discard(server_index: int, warm: dict):
+    """Удаляет заготовку с сервера и освобождает её порт."""
+    await docker_manager.delete_container({'id': warm['container_id']}, SERVERS[server_index])
+    await allocator.release(server_index, warm['port'])
+
+async def _replenish_server(server_index: int, missing: int):
+    server = SERVERS[server_index]
+    for _ in range(missing):
+        allocated = await allocator.allocate_warm(server_index)
+        if allocated is None:
+            return
+        port, name = allocated
+        container_id = await docker_manager.create_stopped_container(server, port, name)
+        if not container_id:
+            await allocator.release(server_index, port)
+            # Сервер недоступен или Docker вернул ошибку - попробуем в следующем цикле
+            return
+        await db.add_warm_container(server_index, container_id, name, port)
+
+async def replenish_once():
+    """Досоздаёт заготовки на серверах, где их меньше size_per_server."""
+    counts = await db.count_warm_containers()
+    await asyncio.gather(*(
+        _replenish_server(index, SIZE_PER_SERVER - counts.get(index, 0))
+        for index in range(len(SERVERS))
+        if counts.get(index, 0) < SIZE_PER_SERVER
+    ))
+
+async def run_warm_pool(interval: int = INTERVAL):
+    """Фоновая задача: поддерживает пул заготовок заполненным."""
+    if SIZE_PER_SERVER <= 0:
+        return
+    while True:
+        try:
+            await replenish_once()
+        except Exception as e:
+            logging.error(f"Ошибка пополнения пула заготовок: {e}")
+        await asyncio.sleep(interval)
+
+async def flush(server_index: int):
+    """Удаляет все заготовки сервера; пул будет пополнен заново (например, из нового образа)."""
+    for warm in await db.take_warm_containers(server_index):
+        await _discard(server_index, warm)
+
+async def claim(server_index: int, user_id: int, tariff: dict) -> dict | None:
+    """
+    Выдаёт пользователю заготовку с сервера: применяет лимиты тарифа, переименовывает и запускает.
+    Возвращает данные контейнера в формате docker_manager.create_container
+    или None, если пул пуст или заготовку не удалось активировать (тогда нужно создавать контейнер с нуля).
+    """
+    if SIZE_PER_SERVER <= 0:
+        return None
+    server = SERVERS[server_index]
+    name = f"Public{docker_manager.generate_random_string()}-Host-{user_id}"
+    try:
+        warm = await db.claim_warm_container(server_index, name)
+    except Exception as e:
+        logging.warning(f"Не удалось взять заготовку с сервера #{server_index}: {e}")
+        return None
+    if warm is None:
+        return None
+
+    if not await docker_manager.activate_container(server, warm['container_id'], tariff, name):
+        await _discard(server_index, warm)
+        return None
+
+    return {
+        "id": warm['container_id'],
+        "name": name,
+        "server_ip": server["ip"],
+        "port": warm['port'],
+        "status": "running",
+        "server_index": server_index,
+        "tariff_id": tariff.get("id"),
+    }
@@ -1,215 +1,941 @@
 # utils/database.py
+import asyncio
 import sqlite3
 import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from config_loader import OWNER_ID
+from utils import migrations
+from utils.user_cache import user_cache
 
 DB_FILE = "data/PublicHost.db"
 
-def init_db():
-    """Инициализирует базу данных и создает таблицы, если их нет."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # --- Создание таблиц (без изменений) ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            balance INTEGER NOT NULL DEFAULT 0,
-            is_blocked BOOLEAN NOT NULL DEFAULT 0,
-            role TEXT NOT NULL DEFAULT 'member'
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tariffs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            price INTEGER NOT NULL,
-            cpu_limit TEXT NOT NULL,
-            memory_limit TEXT NOT NULL
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS containers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            container_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            server_ip TEXT NOT NULL,
-            port INTEGER NOT NULL,
-            status TEXT NOT NULL,
-            server_index INTEGER NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    """)
-
-    # --- ИЗМЕНЕНО: Новая служебная таблица для отслеживания первого запуска ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS bot_settings (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
-        )
-    """)
-
-    # --- ИЗМЕНЕНО: Полностью новая логика для первичной настройки ---
-    cursor.execute("SELECT value FROM bot_settings WHERE key = 'initial_setup_complete'")
-    setup_done = cursor.fetchone()
-
-    # Этот блок кода выполнится ТОЛЬКО ОДИН РАЗ за всю жизнь базы данных
-    if setup_done is None:
-        print("Performing first-time database setup...")
-        # 1. Добавляем тариф по умолчанию
-        cursor.execute("""
-            INSERT INTO tariffs (name, price, cpu_limit, memory_limit)
-            VALUES (?, ?, ?, ?)
-        """, ('Test', 10, '0.5', '256m'))
-        print("Default tariff added.")
-
-        # 2. Устанавливаем флаг, что настройка завершена
-        cursor.execute("INSERT INTO bot_settings (key, value) VALUES (?, ?)", ('initial_setup_complete', '1'))
-        print("Initial setup flag set.")
-
-    # Эта логика будет выполняться при каждом запуске (на случай, если OWNER_ID сменится)
-    cursor.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (OWNER_ID,))
-    cursor.execute("UPDATE users SET role = 'admin' WHERE user_id = ?", (OWNER_ID,))
-    
-    conn.commit()
-    conn.close()
-
-# --- (Остальная часть файла остается без изменений) ---
-def get_or_create_user(user_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    user = cursor.fetchone()
-    if user is None:
-        cursor.execute("INSERT INTO users (user_id) VALUES (?)", (user_id,))
+# Все запросы выполняются через одно долгоживущее соединение в отдельном потоке,
+# чтобы работа с диском не блокировала цикл событий aiogram.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+_conn: sqlite3.Connection | None = None
+
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        # cached_statements - кэш подготовленных запросов sqlite3, повторные запросы не компилируются заново
+        _conn = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=256)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA busy_timeout=5000")
+    return _conn
+
+def _call(func, args):
+    return func(_get_connection(), *args)
+
+async def _run(func, *args):
+    """Выполняет func(conn, *args) в потоке БД и возвращает результат."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _call, func, args)
+
+async def close_db():
+    """Закрывает соединение с БД. Вызывается при остановке бота."""
+    def _close(conn):
+        global _conn
+        conn.close()
+        _conn = None
+    # Операции с балансом, уже поставленные в пачку, дописываются до закрытия соединения
+    await _ledger.drain()
+    if _conn is not None:
+        await _run(_close)
+
+async def init_db():
+    """Инициализирует базу данных: применяет миграции схемы и выполняет первичную настройку."""
+    def _init(conn):
+        cursor = conn.cursor()
+
+        # --- Создание и обновление схемы через версионированные миграции ---
+        migrations.migrate(conn)
+
+        # --- ИЗМЕНЕНО: Полностью новая логика для первичной настройки ---
+        cursor.execute("SELECT value FROM bot_settings WHERE key = 'initial_setup_complete'")
+        setup_done = cursor.fetchone()
+
+        # Этот блок кода выполнится ТОЛЬКО ОДИН РАЗ за всю жизнь базы данных
+        if setup_done is None:
+            print("Performing first-time database setup...")
+            # 1. Добавляем тариф по умолчанию
+            cursor.execute("""
+                INSERT INTO tariffs (name, price, cpu_limit, memory_limit)
+                VALUES (?, ?, ?, ?)
+            """, ('Test', 10, '0.5', '256m'))
+            print("Default tariff added.")
+
+            # 2. Устанавливаем флаг, что настройка завершена
+            cursor.execute("INSERT INTO bot_settings (key, value) VALUES (?, ?)", ('initial_setup_complete', '1'))
+            print("Initial setup flag set.")
+
+        # Эта логика будет выполняться при каждом запуске (на случай, если OWNER_ID сменится)
+        cursor.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (OWNER_ID,))
+        cursor.execute("UPDATE users SET role = 'admin' WHERE user_id = ?", (OWNER_ID,))
+
         conn.commit()
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        user = cursor.fetchone()
-    conn.close()
-    return dict(user)
-
-def update_user_balance(user_id: int, amount_change: int):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount_change, user_id))
-    conn.commit()
-    conn.close()
-
-def set_user_balance(user_id: int, new_balance: int):
-    get_or_create_user(user_id)
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET balance = ? WHERE user_id = ?", (new_balance, user_id))
-    conn.commit()
-    conn.close()
-
-def set_user_blocked_status(user_id: int, is_blocked: bool):
-    get_or_create_user(user_id)
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET is_blocked = ? WHERE user_id = ?", (is_blocked, user_id))
-    conn.commit()
-    conn.close()
-
-def get_all_users_info():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT u.user_id, u.balance, u.is_blocked, COUNT(c.id) as container_count
-        FROM users u
-        LEFT JOIN containers c ON u.user_id = c.user_id
-        GROUP BY u.user_id
-    """)
-    users = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return users
-
-def add_container(user_id: int, container_data: dict):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO containers (user_id, container_id, name, server_ip, port, status, server_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
-        user_id, container_data['id'], container_data['name'],
-        container_data['server_ip'], container_data['port'],
-        container_data['status'], container_data['server_index']
-    ))
-    conn.commit()
-    conn.close()
-
-def get_user_containers(user_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM containers WHERE user_id = ?", (user_id,))
-    containers = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return containers
-
-def get_container_by_db_id(db_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM containers WHERE id = ?", (db_id,))
-    container = cursor.fetchone()
-    conn.close()
-    return dict(container) if container else None
-    
-def delete_container_by_db_id(db_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM containers WHERE id = ?", (db_id,))
-    conn.commit()
-    conn.close()
-
-def update_container_status(db_id: int, new_status: str):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE containers SET status = ? WHERE id = ?", (new_status, db_id))
-    conn.commit()
-    conn.close()
-
-def get_all_containers_info():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM containers")
-    containers = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return containers
-
-def get_tariffs():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM tariffs ORDER BY price")
-    tariffs = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return tariffs
-
-def get_tariff_by_id(tariff_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM tariffs WHERE id = ?", (tariff_id,))
-    tariff = cursor.fetchone()
-    conn.close()
-    return dict(tariff) if tariff else None
-
-def add_tariff(data: dict):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO tariffs (name, price, cpu_limit, memory_limit) VALUES (?, ?, ?, ?)", (data['name'], data['price'], data['cpu_limit'], data['memory_limit']))
-    conn.commit()
-    conn.close()
-
-def delete_tariff_by_id(tariff_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM tariffs WHERE id = ?", (tariff_id,))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+
+    await _run(_init)
+
+async def get_setting(key: str, default: str | None = None):
+    """Читает значение из служебной таблицы bot_settings."""
+    def _query(conn):
+        row = conn.execute("SELECT value FROM bot_settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    return await _run(_query)
+
+async def set_settings(values: dict):
+    """Записывает несколько значений в bot_settings одной транзакцией."""
+    def _query(conn):
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)",
+                             [(key, str(value)) for key, value in values.items()])
+    await _run(_query)
+
+async def get_or_create_user(user_id: int):
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    def _query(conn):
+        user = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if user is None:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+            user = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return dict(user)
+    user = await _run(_query)
+    user_cache.set(user_id, user)
+    return user
+
+# --- Журнал операций с балансом ---
+
+class _LedgerBatcher:
+    """
+    Групповая фиксация операций с балансом: операции, пришедшие, пока предыдущая пачка пишется на диск,
+    выполняются следующей пачкой в одной транзакции BEGIN IMMEDIATE. Каждая операция - в своей точке
+    сохранения, поэтому ошибка одной не откатывает остальные.
+    """
+
+    def __init__(self):
+        self._pending: list = []
+        self._flush_task: asyncio.Task | None = None
+
+    async def submit(self, op, *args):
+        """Выполняет op(conn, *args) в ближайшей пачке и возвращает её результат."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((op, args, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        return await future
+
+    async def drain(self):
+        """Дожидается записи всех поставленных операций."""
+        if self._flush_task is not None:
+            await self._flush_task
+
+    @staticmethod
+    def _execute_batch(conn, batch):
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op, args, _ in batch:
+                conn.execute("SAVEPOINT ledger_op")
+                try:
+                    results.append((True, op(conn, *args)))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO ledger_op")
+                    results.append((False, e))
+                conn.execute("RELEASE ledger_op")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return results
+
+    async def _flush(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    results = await _run(self._execute_batch, batch)
+                except Exception as e:
+                    results = [(False, e)] * len(batch)
+                for (ok, value), (_, _, future) in zip(results, batch):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self._flush_task = None
+
+_ledger = _LedgerBatcher()
+
+def _apply_transaction(conn, user_id: int, amount: int, kind: str, idempotency_key: str | None,
+                       require_funds: bool = False) -> str:
+    """Добавляет операцию в журнал (баланс обновит триггер). Возвращает "ok", "duplicate" или "insufficient"."""
+    if idempotency_key and conn.execute("SELECT 1 FROM transactions WHERE idempotency_key = ?",
+                                        (idempotency_key,)).fetchone():
+        return "duplicate"
+    if require_funds:
+        row = conn.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None or row[0] < -amount:
+            return "insufficient"
+    conn.execute("""
+        INSERT INTO transactions (user_id, amount, kind, idempotency_key, created_at) VALUES (?, ?, ?, ?, ?)
+    """, (user_id, amount, kind, idempotency_key, int(time.time())))
+    return "ok"
+
+async def add_transaction(user_id: int, amount: int, kind: str, idempotency_key: str | None = None) -> bool:
+    """Начисление или списание без проверки баланса. False, если операция с этим ключом уже была."""
+    result = await _ledger.submit(_apply_transaction, user_id, amount, kind, idempotency_key)
+    user_cache.invalidate(user_id)
+    return result == "ok"
+
+async def debit(user_id: int, amount: int, kind: str, idempotency_key: str) -> str:
+    """
+    Атомарно проверяет баланс и списывает amount. Возвращает "ok", "insufficient"
+    или "duplicate" (операция с этим ключом уже была проведена).
+    """
+    result = await _ledger.submit(_apply_transaction, user_id, -amount, kind, idempotency_key, True)
+    user_cache.invalidate(user_id)
+    return result
+
+async def set_user_balance(user_id: int, new_balance: int):
+    """Устанавливает баланс корректирующей операцией в журнале."""
+    def _op(conn):
+        conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+        balance = conn.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if new_balance != balance:
+            _apply_transaction(conn, user_id, new_balance - balance, "admin", None)
+    await _ledger.submit(_op)
+    user_cache.invalidate(user_id)
+
+async def get_user_transactions(user_id: int, limit: int = 10) -> list:
+    """Последние операции пользователя (по индексу (user_id, id))."""
+    def _query(conn):
+        return [dict(row) for row in conn.execute(
+            "SELECT * FROM transactions WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+        )]
+    return await _run(_query)
+
+# --- Заявки на пополнение ---
+
+async def create_payment_request(user_id: int, amount: int) -> int:
+    def _query(conn):
+        with conn:
+            cursor = conn.execute("INSERT INTO payment_requests (user_id, amount, created_at) VALUES (?, ?, ?)",
+                                  (user_id, amount, int(time.time())))
+        return cursor.lastrowid
+    return await _run(_query)
+
+async def decide_payment_request(request_id: int, approve: bool):
+    """
+    Одобряет или отклоняет заявку, если она ещё не обработана; при одобрении зачисляет сумму
+    (ключ payment:{id}). Возвращает (заявка или None, True - если решение принято этим вызовом).
+    """
+    def _op(conn):
+        request = conn.execute("SELECT * FROM payment_requests WHERE id = ?", (request_id,)).fetchone()
+        if request is None:
+            return None, False
+        changed = conn.execute(
+            "UPDATE payment_requests SET status = ?, decided_at = ? WHERE id = ? AND status = 'pending'",
+            ("approved" if approve else "declined", int(time.time()), request_id)
+        ).rowcount == 1
+        if changed and approve:
+            _apply_transaction(conn, request['user_id'], request['amount'], "payment", f"payment:{request_id}")
+        return dict(request), changed
+
+    request, changed = await _ledger.submit(_op)
+    if request:
+        user_cache.invalidate(request['user_id'])
+    return request, changed
+
+async def set_user_blocked_status(user_id: int, is_blocked: bool):
+    def _query(conn):
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+            conn.execute("UPDATE users SET is_blocked = ? WHERE user_id = ?", (is_blocked, user_id))
+    await _run(_query)
+    user_cache.invalidate(user_id)
+
+async def get_users_page(limit: int, offset: int = 0):
+    """Одна страница списка пользователей для админ-панели."""
+    def _query(conn):
+        # container_count поддерживается триггерами, JOIN с containers не нужен
+        return [dict(row) for row in conn.execute(
+            "SELECT user_id, balance, is_blocked, container_count FROM users ORDER BY user_id LIMIT ? OFFSET ?",
+            (limit, offset)
+        )]
+    return await _run(_query)
+
+async def count_users() -> int:
+    def _query(conn):
+        return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    return await _run(_query)
+
+async def add_container(user_id: int, container_data: dict) -> int:
+    """Сохраняет контейнер и возвращает id новой записи."""
+    def _query(conn):
+        with conn:
+            cursor = conn.execute("""
+                INSERT INTO containers (user_id, container_id, name, server_ip, port, status, server_index,
+                                        status_updated_at, tariff_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                user_id, container_data['id'], container_data['name'],
+                container_data['server_ip'], container_data['port'],
+                container_data['status'], container_data['server_index'], int(time.time()),
+                container_data.get('tariff_id')
+            ))
+        return cursor.lastrowid
+    return await _run(_query)
+
+async def get_user_containers(user_id: int):
+    def _query(conn):
+        return [dict(row) for row in conn.execute("SELECT * FROM containers WHERE user_id = ?", (user_id,))]
+    return await _run(_query)
+
+async def get_container_by_db_id(db_id: int):
+    def _query(conn):
+        container = conn.execute("SELECT * FROM containers WHERE id = ?", (db_id,)).fetchone()
+        return dict(container) if container else None
+    return await _run(_query)
+
+async def delete_container_by_db_id(db_id: int):
+    def _query(conn):
+        with conn:
+            conn.execute("DELETE FROM containers WHERE id = ?", (db_id,))
+    await _run(_query)
+
+async def update_container_status(db_id: int, new_status: str):
+    def _query(conn):
+        with conn:
+            conn.execute("UPDATE containers SET status = ?, status_updated_at = ? WHERE id = ?",
+                         (new_status, int(time.time()), db_id))
+    await _run(_query)
+
+async def get_container_by_name(server_index: int, name: str):
+    def _query(conn):
+        container = conn.execute("SELECT * FROM containers WHERE server_index = ? AND name = ?",
+                                 (server_index, name)).fetchone()
+        return dict(container) if container else None
+    return await _run(_query)
+
+async def update_reinstalled_container(db_id: int, container_id: str):
+    """Записывает новый docker id переустановленного контейнера; имя, порт и тариф не меняются."""
+    def _query(conn):
+        with conn:
+            conn.execute("UPDATE containers SET container_id = ?, status = 'running', status_updated_at = ? WHERE id = ?",
+                         (container_id, int(time.time()), db_id))
+    await _run(_query)
+
+async def set_container_status_by_name(server_index: int, name: str, new_status: str):
+    """Обновляет статус контейнера по имени на сервере. Возвращает запись до изменения или None."""
+    def _query(conn):
+        with conn:
+            container = conn.execute("SELECT * FROM containers WHERE server_index = ? AND name = ?",
+                                     (server_index, name)).fetchone()
+            if container:
+                conn.execute("UPDATE containers SET status = ?, status_updated_at = ? WHERE id = ?",
+                             (new_status, int(time.time()), container['id']))
+        return dict(container) if container else None
+    return await _run(_query)
+
+async def touch_server_heartbeat(server_index: int):
+    """Подтверждает, что поток событий сервера жив и статусы его контейнеров актуальны."""
+    def _query(conn):
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO server_heartbeats (server_index, updated_at) VALUES (?, ?)",
+                         (server_index, int(time.time())))
+    await _run(_query)
+
+async def clear_server_heartbeat(server_index: int):
+    def _query(conn):
+        with conn:
+            conn.execute("DELETE FROM server_heartbeats WHERE server_index = ?", (server_index,))
+    await _run(_query)
+
+async def get_server_heartbeats() -> dict:
+    """{server_index: время последнего пульса потока событий}."""
+    def _query(conn):
+        return {row[0]: row[1] for row in conn.execute("SELECT server_index, updated_at FROM server_heartbeats")}
+    return await _run(_query)
+
+async def update_container_statuses(statuses: dict):
+    """Обновляет статусы нескольких контейнеров за одну транзакцию. statuses: {id записи: статус}."""
+    def _query(conn):
+        now = int(time.time())
+        with conn:
+            conn.executemany("UPDATE containers SET status = ?, status_updated_at = ? WHERE id = ?",
+                             [(status, now, db_id) for db_id, status in statuses.items()])
+    await _run(_query)
+
+async def get_containers_page(limit: int, offset: int = 0):
+    """Одна страница списка всех контейнеров для админ-панели."""
+    def _query(conn):
+        return [dict(row) for row in conn.execute(
+            "SELECT * FROM containers ORDER BY id LIMIT ? OFFSET ?", (limit, offset)
+        )]
+    return await _run(_query)
+
+async def count_containers() -> int:
+    def _query(conn):
+        return conn.execute("SELECT COUNT(*) FROM containers").fetchone()[0]
+    return await _run(_query)
+
+async def get_all_containers_info():
+    def _query(conn):
+        return [dict(row) for row in conn.execute("SELECT * FROM containers")]
+    return await _run(_query)
+
+async def get_server_allocations():
+    """
+    Зарезервированные тарифами ресурсы по серверам.
+    Возвращает строки (server_index, cpu_limit, memory_limit, containers), сгруппированные по одинаковым лимитам.
+    Контейнеры без тарифа (созданные до его учёта) считаются с лимитами по умолчанию.
+    """
+    def _query(conn):
+        # Контейнеры, которые ещё только ждут создания в очереди, тоже занимают место на сервере
+        return [dict(row) for row in conn.execute("""
+            SELECT server_index, cpu_limit, memory_limit, COUNT(*) AS containers FROM (
+                SELECT c.server_index,
+                       COALESCE(t.cpu_limit, '0.5') AS cpu_limit,
+                       COALESCE(t.memory_limit, '256m') AS memory_limit
+                FROM containers c
+                LEFT JOIN tariffs t ON t.id = c.tariff_id
+                UNION ALL
+                SELECT server_index,
+                       json_extract(payload, '$.tariff.cpu_limit'),
+                       json_extract(payload, '$.tariff.memory_limit')
+                FROM jobs
+                WHERE kind = 'create' AND status IN ('pending', 'running')
+            )
+            GROUP BY server_index, cpu_limit, memory_limit
+        """)]
+    return await _run(_query)
+
+async def allocate_port_and_name(server_index: int, make_name, port_range: tuple, attempts: int = 16):
+    """
+    Атомарно резервирует на сервере свободный порт и уникальное имя контейнера.
+    Сначала пробует случайные порты, при высокой плотности - ищет первый свободный по порядку.
+    Возвращает (port, name) или None, если свободных портов не осталось.
+    """
+    low, high = port_range
+
+    def _try_insert(conn, port):
+        try:
+            name = make_name()
+            conn.execute("INSERT INTO port_allocations (server_index, port, container_name) VALUES (?, ?, ?)",
+                         (server_index, port, name))
+            return port, name
+        except sqlite3.IntegrityError:
+            return None
+
+    def _query(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for _ in range(attempts):
+                allocated = _try_insert(conn, random.randint(low, high))
+                if allocated:
+                    conn.commit()
+                    return allocated
+
+            # Случайные попытки не удались - берём первый порт после занятого, за которым есть "дыра"
+            row = conn.execute("""
+                SELECT ? AS port WHERE NOT EXISTS (
+                    SELECT 1 FROM port_allocations WHERE server_index = ? AND port = ?
+                )
+                UNION ALL
+                SELECT p.port + 1 FROM port_allocations p
+                WHERE p.server_index = ? AND p.port >= ? AND p.port < ? AND NOT EXISTS (
+                    SELECT 1 FROM port_allocations q WHERE q.server_index = p.server_index AND q.port = p.port + 1
+                )
+                LIMIT 1
+            """, (low, server_index, low, server_index, low, high)).fetchone()
+            allocated = None
+            if row:
+                for _ in range(attempts):
+                    allocated = _try_insert(conn, row[0])
+                    if allocated:
+                        break
+            conn.commit()
+            return allocated
+        except Exception:
+            conn.rollback()
+            raise
+    return await _run(_query)
+
+async def release_port(server_index: int, port: int):
+    def _query(conn):
+        with conn:
+            conn.execute("DELETE FROM port_allocations WHERE server_index = ? AND port = ?", (server_index, port))
+    await _run(_query)
+
+async def replace_host_ports(server_index: int, ports: list):
+    """Заменяет список портов, занятых на сервере сторонними процессами (container_name = NULL)."""
+    def _query(conn):
+        with conn:
+            conn.execute("DELETE FROM port_allocations WHERE server_index = ? AND container_name IS NULL",
+                         (server_index,))
+            conn.executemany("INSERT OR IGNORE INTO port_allocations (server_index, port) VALUES (?, ?)",
+                             [(server_index, port) for port in ports])
+    await _run(_query)
+
+# --- Пул заготовок контейнеров ---
+
+async def add_warm_container(server_index: int, container_id: str, name: str, port: int):
+    def _query(conn):
+        with conn:
+            conn.execute("""
+                INSERT INTO warm_containers (server_index, container_id, name, port, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (server_index, container_id, name, port, int(time.time())))
+    await _run(_query)
+
+async def count_warm_containers() -> dict:
+    """Количество заготовок по серверам: {server_index: count}."""
+    def _query(conn):
+        return {row[0]: row[1] for row in conn.execute(
+            "SELECT server_index, COUNT(*) FROM warm_containers GROUP BY server_index"
+        )}
+    return await _run(_query)
+
+async def claim_warm_container(server_index: int, new_name: str):
+    """
+    Атомарно забирает самую старую заготовку сервера и переписывает её порт на новое имя контейнера.
+    Возвращает запись заготовки или None, если пул пуст.
+    """
+    def _query(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT * FROM warm_containers WHERE server_index = ? ORDER BY id LIMIT 1",
+                               (server_index,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM warm_containers WHERE id = ?", (row['id'],))
+                conn.execute("UPDATE port_allocations SET container_name = ? WHERE server_index = ? AND port = ?",
+                             (new_name, server_index, row['port']))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return dict(row) if row else None
+    return await _run(_query)
+
+async def take_warm_containers(server_index: int) -> list:
+    """Забирает из пула все заготовки сервера (например, чтобы пересоздать их из нового образа)."""
+    def _query(conn):
+        with conn:
+            rows = [dict(row) for row in conn.execute(
+                "SELECT * FROM warm_containers WHERE server_index = ?", (server_index,)
+            )]
+            conn.execute("DELETE FROM warm_containers WHERE server_index = ?", (server_index,))
+        return rows
+    return await _run(_query)
+
+# --- Образы на серверах ---
+
+async def get_server_images() -> dict:
+    """Сохранённые digest'ы образа: {server_index: {"digest": ..., "pulled_at": ...}}."""
+    def _query(conn):
+        return {row['server_index']: dict(row) for row in conn.execute("SELECT * FROM server_images")}
+    return await _run(_query)
+
+async def set_server_image(server_index: int, digest: str):
+    def _query(conn):
+        with conn:
+            conn.execute("""
+                INSERT INTO server_images (server_index, digest, pulled_at) VALUES (?, ?, ?)
+                ON CONFLICT(server_index) DO UPDATE SET digest = excluded.digest, pulled_at = excluded.pulled_at
+            """, (server_index, digest, int(time.time())))
+    await _run(_query)
+
+# --- Метрики потребления ресурсов ---
+
+ROLLUP_BUCKET = 300
+
+async def add_metrics(server_index: int, ts: int, samples: list):
+    """
+    Сохраняет замеры одного сервера одним executemany и обновляет итог по серверу.
+    samples: [(id записи контейнера, cpu в %, память в МБ)].
+    """
+    def _query(conn):
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO metrics_raw (container_id, ts, cpu, memory_mb) VALUES (?, ?, ?, ?)",
+                             [(container_id, ts, cpu, memory_mb) for container_id, cpu, memory_mb in samples])
+            conn.execute("""
+                INSERT OR REPLACE INTO server_usage (server_index, ts, cpu, memory_mb, containers)
+                VALUES (?, ?, ?, ?, ?)
+            """, (server_index, ts, sum(s[1] for s in samples), sum(s[2] for s in samples), len(samples)))
+    await _run(_query)
+
+async def rollup_and_prune_metrics(raw_retention: int, rollup_retention: int):
+    """
+    Сворачивает завершившиеся 5-минутные интервалы сырых замеров в metrics_5m
+    и удаляет данные старше сроков хранения (в секундах).
+    """
+    def _query(conn):
+        now = int(time.time())
+        current_bucket = now - now % ROLLUP_BUCKET
+        rolled_until = conn.execute("SELECT value FROM bot_settings WHERE key = 'metrics_rolled_until'").fetchone()
+        start = int(rolled_until[0]) if rolled_until else current_bucket - raw_retention
+        if start >= current_bucket:
+            return
+        with conn:
+            conn.execute(f"""
+                INSERT OR REPLACE INTO metrics_5m
+                    (container_id, bucket, cpu_avg, cpu_max, memory_avg, memory_max, samples)
+                SELECT container_id, ts - ts % {ROLLUP_BUCKET}, AVG(cpu), MAX(cpu), AVG(memory_mb), MAX(memory_mb), COUNT(*)
+                FROM metrics_raw WHERE ts >= ? AND ts < ?
+                GROUP BY container_id, ts - ts % {ROLLUP_BUCKET}
+            """, (start, current_bucket))
+            conn.execute("INSERT OR REPLACE INTO bot_settings (key, value) VALUES ('metrics_rolled_until', ?)",
+                         (str(current_bucket),))
+            conn.execute("DELETE FROM metrics_raw WHERE ts < ?", (now - raw_retention,))
+            conn.execute("DELETE FROM metrics_5m WHERE bucket < ?", (now - rollup_retention,))
+    await _run(_query)
+
+async def get_container_usage(db_id: int, since: int):
+    """Последний замер контейнера и средние значения с момента since. None, если замеров нет."""
+    def _query(conn):
+        row = conn.execute("""
+            SELECT
+                (SELECT cpu FROM metrics_raw WHERE container_id = :id ORDER BY ts DESC LIMIT 1) AS cpu,
+                (SELECT memory_mb FROM metrics_raw WHERE container_id = :id ORDER BY ts DESC LIMIT 1) AS memory_mb,
+                (SELECT MAX(ts) FROM metrics_raw WHERE container_id = :id) AS ts,
+                AVG(cpu) AS cpu_avg, AVG(memory_mb) AS memory_avg
+            FROM metrics_raw WHERE container_id = :id AND ts >= :since
+        """, {"id": db_id, "since": since}).fetchone()
+        return dict(row) if row and row['ts'] is not None else None
+    return await _run(_query)
+
+async def get_servers_usage() -> dict:
+    """Итоги последнего замера по серверам: {server_index: {...}}."""
+    def _query(conn):
+        return {row['server_index']: dict(row) for row in conn.execute("SELECT * FROM server_usage")}
+    return await _run(_query)
+
+# --- Биллинг ---
+
+def _container_price_sql(alias: str = "c") -> str:
+    # Контейнеры без тарифа (созданные до его учёта) продлеваются бесплатно
+    return f"COALESCE((SELECT price FROM tariffs WHERE id = {alias}.tariff_id), 0)"
+
+async def charge_due_containers(period: int) -> dict:
+    """
+    Один цикл списаний за одну транзакцию для всех пользователей сразу.
+    Контейнерам с истёкшим периодом: если баланса хватает на все просроченные контейнеры
+    пользователя - списывает сумму и продлевает их на period, иначе приостанавливает их.
+    Возвращает {"charged": [user_id, ...], "suspended": [записи контейнеров]}.
+    """
+    def _query(conn):
+        now = int(time.time())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE containers SET paid_until = ? WHERE paid_until IS NULL", (now + period,))
+            # Временные таблицы с первичными ключами, чтобы последующие UPDATE искали по индексу
+            conn.execute("DROP TABLE IF EXISTS temp.due")
+            conn.execute("CREATE TEMP TABLE due (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, price INTEGER NOT NULL)")
+            conn.execute(f"""
+                INSERT INTO due (id, user_id, price)
+                SELECT c.id, c.user_id, {_container_price_sql()}
+                FROM containers c WHERE c.suspended = 0 AND c.paid_until <= ?
+            """, (now,))
+            conn.execute("DROP TABLE IF EXISTS temp.due_users")
+            conn.execute("CREATE TEMP TABLE due_users (user_id INTEGER PRIMARY KEY, total INTEGER NOT NULL, can_pay INTEGER NOT NULL)")
+            conn.execute("""
+                INSERT INTO due_users (user_id, total, can_pay)
+                SELECT d.user_id, SUM(d.price), u.balance >= SUM(d.price)
+                FROM due d JOIN users u ON u.user_id = d.user_id
+                GROUP BY d.user_id
+            """)
+            # Списания идут через журнал: баланс обновит триггер
+            conn.execute("""
+                INSERT INTO transactions (user_id, amount, kind, idempotency_key, created_at)
+                SELECT user_id, -total, 'billing', 'billing:' || user_id || ':' || :now, :now
+                FROM due_users WHERE can_pay AND total > 0
+            """, {"now": now})
+            conn.execute("""
+                UPDATE containers SET paid_until = paid_until + ?
+                WHERE id IN (SELECT id FROM due WHERE user_id IN (SELECT user_id FROM due_users WHERE can_pay))
+            """, (period,))
+            suspended = [dict(row) for row in conn.execute("""
+                UPDATE containers SET suspended = 1
+                WHERE id IN (SELECT id FROM due WHERE user_id IN (SELECT user_id FROM due_users WHERE NOT can_pay))
+                RETURNING *
+            """)]
+            charged = [row[0] for row in conn.execute("SELECT user_id FROM due_users WHERE can_pay")]
+            conn.execute("DROP TABLE temp.due")
+            conn.execute("DROP TABLE temp.due_users")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return {"charged": charged, "suspended": suspended}
+
+    result = await _run(_query)
+    for user_id in result["charged"]:
+        user_cache.invalidate(user_id)
+    return result
+
+async def resume_user_containers(user_id: int, period: int) -> list:
+    """
+    Возобновляет приостановленные контейнеры пользователя, на которые хватает баланса:
+    списывает цену и начинает новый период. Возвращает записи возобновлённых контейнеров.
+    """
+    def _query(conn):
+        now = int(time.time())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            balance = conn.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+            resumed = []
+            for container in conn.execute(f"""
+                SELECT c.*, {_container_price_sql()} AS price FROM containers c
+                WHERE c.user_id = ? AND c.suspended = 1 ORDER BY c.id
+            """, (user_id,)).fetchall():
+                if balance < container['price']:
+                    break
+                balance -= container['price']
+                resumed.append(dict(container))
+            if resumed:
+                total = sum(container['price'] for container in resumed)
+                if total:
+                    _apply_transaction(conn, user_id, -total, "billing", f"resume:{user_id}:{now}")
+                conn.execute("UPDATE users SET billing_warned_at = NULL WHERE user_id = ?", (user_id,))
+                conn.executemany("UPDATE containers SET suspended = 0, paid_until = ? WHERE id = ?",
+                                 [(now + period, container['id']) for container in resumed])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return resumed
+
+    resumed = await _run(_query)
+    user_cache.invalidate(user_id)
+    return resumed
+
+async def get_running_suspended_containers() -> list:
+    """Приостановленные контейнеры, остановка которых на сервере ещё не подтверждена."""
+    def _query(conn):
+        return [dict(row) for row in conn.execute(
+            "SELECT * FROM containers WHERE suspended = 1 AND status != 'exited'"
+        )]
+    return await _run(_query)
+
+async def get_users_to_warn(warn_ahead: int) -> list:
+    """
+    Пользователи, чьего баланса не хватит на продление контейнеров в ближайшие warn_ahead секунд
+    и которых ещё не предупреждали в этом окне. Отмечает их как предупреждённых.
+    Возвращает [{"user_id", "balance", "total", "paid_until"}].
+    """
+    def _query(conn):
+        now = int(time.time())
+        with conn:
+            rows = [dict(row) for row in conn.execute(f"""
+                SELECT c.user_id, u.balance, SUM({_container_price_sql()}) AS total, MIN(c.paid_until) AS paid_until
+                FROM containers c JOIN users u ON u.user_id = c.user_id
+                WHERE c.suspended = 0 AND c.paid_until <= :deadline
+                  AND (u.billing_warned_at IS NULL OR u.billing_warned_at < :window_start)
+                GROUP BY c.user_id
+                HAVING u.balance < total
+            """, {"deadline": now + warn_ahead, "window_start": now - warn_ahead})]
+            conn.executemany("UPDATE users SET billing_warned_at = ? WHERE user_id = ?",
+                             [(now, row['user_id']) for row in rows])
+        return rows
+    return await _run(_query)
+
+# --- Состояния FSM ---
+
+async def load_fsm_state(key: str):
+    """Возвращает (state, data в JSON, updated_at) или None."""
+    def _query(conn):
+        row = conn.execute("SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row else None
+    return await _run(_query)
+
+async def save_fsm_states(rows: list):
+    """
+    Записывает пачку состояний одной транзакцией. rows: [(key, state, data в JSON, updated_at)];
+    пустые записи (нет ни состояния, ни данных) удаляются.
+    """
+    def _query(conn):
+        empty = [(row[0],) for row in rows if row[1] is None and row[2] == "{}"]
+        filled = [row for row in rows if not (row[1] is None and row[2] == "{}")]
+        with conn:
+            conn.executemany("DELETE FROM fsm_states WHERE key = ?", empty)
+            conn.executemany("""
+                INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """, filled)
+    await _run(_query)
+
+async def purge_fsm_states(older_than: int) -> int:
+    """Удаляет брошенные сценарии, не менявшиеся с момента older_than."""
+    def _query(conn):
+        with conn:
+            return conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (older_than,)).rowcount
+    return await _run(_query)
+
+# --- Аренда лидерства (режим нескольких процессов) ---
+
+async def acquire_lease(name: str, holder: str, ttl: float) -> bool:
+    """Захватывает или продлевает аренду name на ttl секунд. True, если аренда принадлежит holder."""
+    def _query(conn):
+        now = time.time()
+        with conn:
+            conn.execute("""
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            """, (name, holder, now + ttl, now))
+            row = conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == holder
+    return await _run(_query)
+
+async def release_lease(name: str, holder: str):
+    """Освобождает аренду, чтобы другой процесс мог занять её, не дожидаясь истечения."""
+    def _query(conn):
+        with conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    await _run(_query)
+
+# --- Очередь задач провижининга ---
+
+def _job_from_row(row) -> dict:
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    return job
+
+def _insert_job(conn, kind: str, user_id: int, server_index: int, payload: dict,
+                chat_id: int | None, message_id: int | None) -> int:
+    now = int(time.time())
+    cursor = conn.execute("""
+        INSERT INTO jobs (kind, user_id, server_index, payload, chat_id, message_id, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (kind, user_id, server_index, json.dumps(payload), chat_id, message_id, now, now))
+    return cursor.lastrowid
+
+async def create_job(kind: str, user_id: int, server_index: int, payload: dict,
+                     chat_id: int | None = None, message_id: int | None = None) -> int:
+    def _query(conn):
+        with conn:
+            return _insert_job(conn, kind, user_id, server_index, payload, chat_id, message_id)
+    return await _run(_query)
+
+async def purchase(user_id: int, amount: int, idempotency_key: str, server_index: int, payload: dict,
+                   chat_id: int | None = None, message_id: int | None = None) -> tuple[str, int | None]:
+    """
+    Списание за покупку и задача на создание контейнера - в одной транзакции: деньги не спишутся без задачи.
+    Возвращает (результат как у debit, id задачи или None).
+    """
+    def _op(conn):
+        result = _apply_transaction(conn, user_id, -amount, "purchase", idempotency_key, True)
+        if result != "ok":
+            return result, None
+        return result, _insert_job(conn, "create", user_id, server_index, payload, chat_id, message_id)
+    result = await _ledger.submit(_op)
+    user_cache.invalidate(user_id)
+    return result
+
+async def set_job_message(job_id: int, chat_id: int, message_id: int):
+    """Сообщение, которое задача редактирует по ходу выполнения."""
+    def _query(conn):
+        with conn:
+            conn.execute("UPDATE jobs SET chat_id = ?, message_id = ?, updated_at = ? WHERE id = ?",
+                         (chat_id, message_id, int(time.time()), job_id))
+    await _run(_query)
+
+async def claim_job(server_index: int):
+    """Атомарно забирает самую старую готовую к выполнению задачу сервера и помечает её running."""
+    def _query(conn):
+        now = int(time.time())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("""
+                SELECT * FROM jobs
+                WHERE status = 'pending' AND server_index = ? AND next_run_at <= ?
+                ORDER BY id LIMIT 1
+            """, (server_index, now)).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                             (now, row['id']))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if row is None:
+            return None
+        job = _job_from_row(row)
+        job['attempts'] += 1
+        return job
+    return await _run(_query)
+
+async def get_ready_job_servers() -> list:
+    """Серверы, у которых есть готовые к выполнению задачи (по индексу очереди)."""
+    def _query(conn):
+        return [row[0] for row in conn.execute(
+            "SELECT DISTINCT server_index FROM jobs WHERE status = 'pending' AND next_run_at <= ?",
+            (int(time.time()),)
+        )]
+    return await _run(_query)
+
+async def save_job_payload(job_id: int, payload: dict):
+    """Сохраняет промежуточный результат задачи, чтобы повтор продолжил с того же места."""
+    def _query(conn):
+        with conn:
+            conn.execute("UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                         (json.dumps(payload), int(time.time()), job_id))
+    await _run(_query)
+
+async def reschedule_job(job_id: int, delay: int, error: str):
+    def _query(conn):
+        now = int(time.time())
+        with conn:
+            conn.execute("UPDATE jobs SET status = 'pending', next_run_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                         (now + delay, error, now, job_id))
+    await _run(_query)
+
+async def finish_job(job_id: int, status: str, error: str | None = None):
+    def _query(conn):
+        with conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                         (status, error, int(time.time()), job_id))
+    await _run(_query)
+
+async def requeue_running_jobs() -> int:
+    """Возвращает в очередь задачи, прерванные перезапуском бота. Возвращает их количество."""
+    def _query(conn):
+        with conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'pending', updated_at = ? WHERE status = 'running'",
+                                  (int(time.time()),))
+        return cursor.rowcount
+    return await _run(_query)
+
+async def get_tariffs():
+    def _query(conn):
+        return [dict(row) for row in conn.execute("SELECT * FROM tariffs ORDER BY price")]
+    return await _run(_query)
+
+async def get_tariff_by_id(tariff_id: int):
+    def _query(conn):
+        tariff = conn.execute("SELECT * FROM tariffs WHERE id = ?", (tariff_id,)).fetchone()
+        return dict(tariff) if tariff else None
+    return await _run(_query)
+
+async def add_tariff(data: dict):
+    def _query(conn):
+        with conn:
+            conn.execute("INSERT INTO tariffs (name, price, cpu_limit, memory_limit) VALUES (?, ?, ?, ?)",
+                         (data['name'], data['price'], data['cpu_limit'], data['memory_limit']))
+    await _run(_query)
+
+async def delete_tariff_by_id(tariff_id: int):
+    def _query(conn):
+        with conn:
+            conn.execute("DELETE FROM tariffs WHERE id = ?", (tariff_id,))
+    await _run(_query)
@@ -0,0 +1,124 @@
+# utils/fsm_storage.py
+import asyncio
+import contextlib
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from config_loader import FSM_STORAGE
+from utils import database as db
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_states основной БД.
+    Чтения обслуживает LRU-кэш в памяти, записи копятся и сбрасываются в БД пачкой
+    раз в flush_interval секунд (write-behind). Сценарии, брошенные дольше ttl секунд, забываются.
+    """
+
+    def __init__(self, cache_size: int = 10000, flush_interval: float = 1, ttl: float = 86400,
+                 key_builder: KeyBuilder | None = None):
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        # {ключ: (state, data, updated_at)}
+        self._cache: OrderedDict[str, tuple] = OrderedDict()
+        # Изменения, ещё не записанные в БД; не вытесняются из памяти до записи
+        self._dirty: dict[str, tuple] = {}
+        self._flusher: asyncio.Task | None = None
+        self._last_purge = 0.0
+
+    # --- Кэш и отложенная запись ---
+
+    async def _load(self, key: str) -> tuple:
+        entry = self._dirty.get(key) or self._cache.get(key)
+        if entry is None:
+            row = await db.load_fsm_state(key)
+            entry = (row[0], json.loads(row[1]), row[2]) if row else (None, {}, 0)
+            self._remember(key, entry)
+        elif key in self._cache:
+            self._cache.move_to_end(key)
+
+        state, data, updated_at = entry
+        if updated_at and time.time() - updated_at > self.ttl:
+            return None, {}, 0
+        return entry
+
+    def _remember(self, key: str, entry: tuple):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, key: str, state: str | None, data: dict):
+        entry = (state, data, int(time.time()))
+        self._remember(key, entry)
+        self._dirty[key] = entry
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def flush(self):
+        """Записывает накопленные изменения в БД одной транзакцией."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        rows = [(key, state, json.dumps(data, ensure_ascii=False), updated_at)
+                for key, (state, data, updated_at) in dirty.items()]
+        try:
+            await db.save_fsm_states(rows)
+        except Exception:
+            # Не теряем изменения: вернём их в очередь (более новые записи не перетираем)
+            for key, entry in dirty.items():
+                self._dirty.setdefault(key, entry)
+            raise
+
+    async def _flush_loop(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_purge > self.ttl / 10:
+                    self._last_purge = time.monotonic()
+                    await db.purge_fsm_states(int(time.time() - self.ttl))
+            except Exception as e:
+                logging.error(f"FSM: не удалось сохранить состояния: {e}")
+
+    # --- Интерфейс BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data, _ = await self._load(storage_key)
+        self._store(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _, _ = await self._load(storage_key)
+        self._store(storage_key, state, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data, _ = await self._load(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flusher
+            self._flusher = None
+        await self.flush()
+
+
+def create_storage() -> SQLiteStorage:
+    return SQLiteStorage(**FSM_STORAGE)
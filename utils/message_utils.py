@@ -2,10 +2,83 @@
 from aiogram.types import Message, CallbackQuery, InputMediaPhoto, FSInputFile
 from aiogram.exceptions import TelegramBadRequest
 from config_loader import BANNER_LOCAL_PATH
+from utils import database as db
+import asyncio
 import contextlib
+import hashlib
 import pathlib
 import logging
 
+
+class _BannerCache:
+    """
+    Баннер загружается в Telegram один раз, дальше отправляется по file_id.
+    file_id хранится в bot_settings вместе с хэшем файла и сбрасывается, если файл изменился:
+    mtime файла проверяется при каждом использовании, хэш пересчитывается только при его смене.
+    """
+
+    def __init__(self):
+        self.path: pathlib.Path | None = None
+        # mtime файла, по которому посчитан file_hash: пока он не изменился, файл не перечитывается
+        self.mtime: int | None = None
+        self.file_hash: str | None = None
+        self.file_id: str | None = None
+
+    async def load(self) -> bool:
+        """
+        Проверяет файл баннера и, если он изменился с прошлого раза, перечитывает его хэш и сохранённый file_id.
+        Возвращает False, если файла нет.
+        """
+        base_path = pathlib.Path(__file__).parent.parent
+        absolute_banner_path = base_path / BANNER_LOCAL_PATH
+        try:
+            mtime = absolute_banner_path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is None or not absolute_banner_path.is_file():
+            logging.error(f"CRITICAL: Banner file not found at path: {absolute_banner_path}")
+            self.mtime = None
+            return False
+        if mtime == self.mtime:
+            return True
+
+        content = await asyncio.to_thread(absolute_banner_path.read_bytes)
+        file_hash = hashlib.sha256(content).hexdigest()
+        self.path = absolute_banner_path
+        self.mtime = mtime
+        if file_hash != self.file_hash:
+            # Новый файл: file_id берём из БД, только если он загружался раньше именно с этим содержимым
+            self.file_hash = file_hash
+            self.file_id = None
+            if await db.get_setting("banner_hash") == file_hash:
+                self.file_id = await db.get_setting("banner_file_id")
+            else:
+                logging.info("Banner file changed, it will be re-uploaded on next use")
+        return True
+
+    async def send(self, send_photo):
+        """
+        Вызывает send_photo(photo) с file_id, а если его ещё нет (или Telegram его отверг) -
+        с загрузкой файла, после чего запоминает полученный file_id.
+        """
+        if self.file_id:
+            try:
+                return await send_photo(self.file_id)
+            except TelegramBadRequest as e:
+                if "file" not in str(e).lower():
+                    raise
+                logging.warning(f"Cached banner file_id was rejected, re-uploading. Reason: {e}")
+                self.file_id = None
+
+        result = await send_photo(FSInputFile(self.path))
+        if isinstance(result, Message) and result.photo:
+            self.file_id = result.photo[-1].file_id
+            await db.set_settings({"banner_file_id": self.file_id, "banner_hash": self.file_hash})
+        return result
+
+
+_banner = _BannerCache()
+
 async def send_or_edit_message_with_banner(
     event: Message | CallbackQuery,
     text: str,
@@ -13,60 +86,58 @@ async def send_or_edit_message_with_banner(
     parse_mode: str = "HTML"
 ):
     """
-    Отправляет или редактирует сообщение, всегда добавляя к нему баннер из локального файла.
-    Использует абсолютный путь к файлу для надежности.
+    Отправляет или редактирует сообщение, всегда добавляя к нему баннер.
+    Файл баннера загружается в Telegram только один раз, дальше используется его file_id.
+    Возвращает итоговое сообщение (None, если его не удалось определить).
     """
-    base_path = pathlib.Path(__file__).parent.parent
-    absolute_banner_path = base_path / BANNER_LOCAL_PATH
-
     # Проверяем, существует ли файл. Если нет - отправляем текстовое сообщение.
-    if not absolute_banner_path.is_file():
-        logging.error(f"CRITICAL: Banner file not found at path: {absolute_banner_path}")
+    if not await _banner.load():
         if isinstance(event, Message):
-            await event.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            return await event.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
         elif isinstance(event, CallbackQuery):
             await event.answer()
-            await event.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
-        return
-
-    banner_file = FSInputFile(absolute_banner_path)
+            return await event.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        return None
 
     if isinstance(event, Message):
         try:
-            await event.answer_photo(
-                photo=banner_file,
+            return await _banner.send(lambda photo: event.answer_photo(
+                photo=photo,
                 caption=text,
                 parse_mode=parse_mode,
                 reply_markup=reply_markup
-            )
+            ))
         except Exception as e:
             logging.error(f"Failed to send photo: {e}")
-            await event.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            return await event.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
 
     elif isinstance(event, CallbackQuery):
         await event.answer()
-        
+
         try:
-            await event.message.edit_media(
+            edited = await _banner.send(lambda photo: event.message.edit_media(
                 media=InputMediaPhoto(
-                    media=banner_file,
+                    media=photo,
                     caption=text,
                     parse_mode=parse_mode
                 ),
                 reply_markup=reply_markup
-            )
-            return
+            ))
+            return edited if isinstance(edited, Message) else event.message
         except TelegramBadRequest as e:
+            # С тем же file_id повторное нажатие кнопки даёт "not modified" - сообщение уже актуально
+            if "message is not modified" in str(e):
+                return event.message
             logging.info(f"Couldn't edit media, falling back to sending new message. Reason: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred during edit_media: {e}")
 
         with contextlib.suppress(TelegramBadRequest):
             await event.message.delete()
-        
-        await event.message.answer_photo(
-            photo=banner_file,
+
+        return await _banner.send(lambda photo: event.message.answer_photo(
+            photo=photo,
             caption=text,
             parse_mode=parse_mode,
             reply_markup=reply_markup
-        )
\ No newline at end of file
+        ))
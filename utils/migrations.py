@@ -0,0 +1,338 @@
+# utils/migrations.py
+import sqlite3
+
+# Номер применённой версии схемы хранится в bot_settings под этим ключом
+SCHEMA_VERSION_KEY = "schema_version"
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+# --- Миграции. Каждая выполняется ровно один раз, в отдельной транзакции ---
+
+def _create_base_tables(conn: sqlite3.Connection):
+    """Исходная схема. IF NOT EXISTS - чтобы подхватить базы, созданные до появления миграций."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            balance INTEGER NOT NULL DEFAULT 0,
+            is_blocked BOOLEAN NOT NULL DEFAULT 0,
+            role TEXT NOT NULL DEFAULT 'member'
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tariffs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            cpu_limit TEXT NOT NULL,
+            memory_limit TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS containers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            container_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            server_ip TEXT NOT NULL,
+            port INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            server_index INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    """)
+
+def _add_status_updated_at(conn: sqlite3.Connection):
+    """Время последнего обновления кэшированного статуса контейнера."""
+    if "status_updated_at" not in _columns(conn, "containers"):
+        conn.execute("ALTER TABLE containers ADD COLUMN status_updated_at INTEGER NOT NULL DEFAULT 0")
+
+def _add_container_indexes(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_containers_user_id ON containers (user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_containers_server_index ON containers (server_index)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_containers_container_id ON containers (container_id)")
+
+def _add_user_container_count(conn: sqlite3.Connection):
+    """
+    Счётчик контейнеров пользователя, поддерживаемый триггерами,
+    чтобы список пользователей в админке не сканировал таблицу containers.
+    """
+    conn.execute("ALTER TABLE users ADD COLUMN container_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        UPDATE users SET container_count = (
+            SELECT COUNT(*) FROM containers c WHERE c.user_id = users.user_id
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER trg_containers_count_insert AFTER INSERT ON containers
+        BEGIN
+            UPDATE users SET container_count = container_count + 1 WHERE user_id = NEW.user_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER trg_containers_count_delete AFTER DELETE ON containers
+        BEGIN
+            UPDATE users SET container_count = container_count - 1 WHERE user_id = OLD.user_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER trg_containers_count_update AFTER UPDATE OF user_id ON containers
+        WHEN OLD.user_id != NEW.user_id
+        BEGIN
+            UPDATE users SET container_count = container_count - 1 WHERE user_id = OLD.user_id;
+            UPDATE users SET container_count = container_count + 1 WHERE user_id = NEW.user_id;
+        END
+    """)
+
+def _add_container_tariff(conn: sqlite3.Connection):
+    """Тариф, по которому создан контейнер. У старых записей NULL - для них действуют лимиты по умолчанию."""
+    conn.execute("ALTER TABLE containers ADD COLUMN tariff_id INTEGER REFERENCES tariffs (id)")
+
+def _add_port_allocations(conn: sqlite3.Connection):
+    """
+    Занятые порты и имена контейнеров на каждом сервере. container_name = NULL -
+    порт занят чем-то другим на хосте (обнаружен при проверке слушающих портов).
+    Запись освобождается триггером при удалении контейнера из БД.
+    """
+    conn.execute("""
+        CREATE TABLE port_allocations (
+            server_index INTEGER NOT NULL,
+            port INTEGER NOT NULL,
+            container_name TEXT,
+            PRIMARY KEY (server_index, port),
+            UNIQUE (server_index, container_name)
+        )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO port_allocations (server_index, port, container_name)
+        SELECT server_index, port, name FROM containers
+    """)
+    conn.execute("""
+        CREATE TRIGGER trg_containers_release_port AFTER DELETE ON containers
+        BEGIN
+            DELETE FROM port_allocations
+            WHERE server_index = OLD.server_index AND port = OLD.port AND container_name = OLD.name;
+        END
+    """)
+
+def _add_jobs(conn: sqlite3.Connection):
+    """Очередь задач создания/удаления/переустановки контейнеров, переживающая перезапуск бота."""
+    conn.execute("""
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            user_id INTEGER NOT NULL,
+            server_index INTEGER NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_run_at INTEGER NOT NULL DEFAULT 0,
+            chat_id INTEGER,
+            message_id INTEGER,
+            error TEXT,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_jobs_queue ON jobs (status, server_index, next_run_at)")
+
+def _add_warm_containers(conn: sqlite3.Connection):
+    """Заранее созданные остановленные контейнеры, которые выдаются при покупке вместо `docker run`."""
+    conn.execute("""
+        CREATE TABLE warm_containers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            server_index INTEGER NOT NULL,
+            container_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            port INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_warm_containers_server ON warm_containers (server_index)")
+
+def _add_server_images(conn: sqlite3.Connection):
+    """Digest образа, скачанного на каждый сервер: по нему создаются контейнеры и видно расхождение версий."""
+    conn.execute("""
+        CREATE TABLE server_images (
+            server_index INTEGER PRIMARY KEY,
+            digest TEXT NOT NULL,
+            pulled_at INTEGER NOT NULL
+        )
+    """)
+
+def _add_metrics(conn: sqlite3.Connection):
+    """
+    Потребление ресурсов контейнерами: сырые замеры (хранятся сутки) и 5-минутные агрегаты (30 дней).
+    WITHOUT ROWID с составным ключом - строки хранятся прямо в индексе, без отдельной таблицы.
+    """
+    conn.execute("""
+        CREATE TABLE metrics_raw (
+            container_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            cpu REAL NOT NULL,
+            memory_mb REAL NOT NULL,
+            PRIMARY KEY (container_id, ts)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_metrics_raw_ts ON metrics_raw (ts)")
+    conn.execute("""
+        CREATE TABLE metrics_5m (
+            container_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            cpu_avg REAL NOT NULL,
+            cpu_max REAL NOT NULL,
+            memory_avg REAL NOT NULL,
+            memory_max REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (container_id, bucket)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_metrics_5m_bucket ON metrics_5m (bucket)")
+    # Суммарное потребление по серверу за последний замер
+    conn.execute("""
+        CREATE TABLE server_usage (
+            server_index INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            cpu REAL NOT NULL,
+            memory_mb REAL NOT NULL,
+            containers INTEGER NOT NULL
+        )
+    """)
+
+def _add_billing(conn: sqlite3.Connection):
+    """
+    Периодическая оплата. paid_until = NULL - период ещё не начат (его назначит первый цикл биллинга),
+    suspended = 1 - контейнер остановлен за неуплату и будет запущен после пополнения баланса.
+    """
+    conn.execute("ALTER TABLE containers ADD COLUMN paid_until INTEGER")
+    conn.execute("ALTER TABLE containers ADD COLUMN suspended INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE users ADD COLUMN billing_warned_at INTEGER")
+    conn.execute("CREATE INDEX idx_containers_paid_until ON containers (suspended, paid_until)")
+
+def _add_ledger(conn: sqlite3.Connection):
+    """
+    Журнал операций с балансом. users.balance становится производным значением: его меняет
+    только триггер при добавлении операции. idempotency_key не даёт применить одну операцию дважды.
+    Текущие балансы переносятся в журнал начальными операциями (до создания триггера).
+    """
+    conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_transactions_user ON transactions (user_id, id)")
+    conn.execute("""
+        INSERT INTO transactions (user_id, amount, kind, idempotency_key, created_at)
+        SELECT user_id, balance, 'opening', 'opening:' || user_id, CAST(strftime('%s', 'now') AS INTEGER)
+        FROM users WHERE balance != 0
+    """)
+    conn.execute("""
+        CREATE TRIGGER trg_transactions_apply AFTER INSERT ON transactions
+        BEGIN
+            INSERT OR IGNORE INTO users (user_id) VALUES (NEW.user_id);
+            UPDATE users SET balance = balance + NEW.amount WHERE user_id = NEW.user_id;
+        END
+    """)
+    # Заявки на пополнение: ключ операции одобрения - payment:{id}
+    conn.execute("""
+        CREATE TABLE payment_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at INTEGER NOT NULL,
+            decided_at INTEGER
+        )
+    """)
+
+def _add_fsm_states(conn: sqlite3.Connection):
+    """Состояния FSM (пополнение баланса, мастер тарифов), чтобы они переживали перезапуск бота."""
+    conn.execute("""
+        CREATE TABLE fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_fsm_states_updated ON fsm_states (updated_at)")
+
+
+def _add_leases(conn: sqlite3.Connection):
+    """Аренды для выбора процесса-лидера, который выполняет фоновые задачи в режиме нескольких воркеров."""
+    conn.execute("""
+        CREATE TABLE leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+
+
+def _add_server_heartbeats(conn: sqlite3.Connection):
+    """
+    Пульс потока событий Docker: пока он свежий, статусы всех контейнеров сервера актуальны
+    без перезаписи status_updated_at в каждой строке.
+    """
+    conn.execute("""
+        CREATE TABLE server_heartbeats (
+            server_index INTEGER PRIMARY KEY,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+
+
+# Упорядоченный список миграций: (версия, функция). Новые миграции добавляются только в конец.
+MIGRATIONS = [
+    (1, _create_base_tables),
+    (2, _add_status_updated_at),
+    (3, _add_container_indexes),
+    (4, _add_user_container_count),
+    (5, _add_container_tariff),
+    (6, _add_port_allocations),
+    (7, _add_jobs),
+    (8, _add_warm_containers),
+    (9, _add_server_images),
+    (10, _add_metrics),
+    (11, _add_billing),
+    (12, _add_ledger),
+    (13, _add_fsm_states),
+    (14, _add_leases),
+    (15, _add_server_heartbeats),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM bot_settings WHERE key = ?", (SCHEMA_VERSION_KEY,)).fetchone()
+    return int(row[0]) if row else 0
+
+def migrate(conn: sqlite3.Connection):
+    """Применяет по порядку все миграции, версия которых больше сохранённой в bot_settings."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+
+    current = get_schema_version(conn)
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"Applying database migration {version}: {migration.__name__}...")
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute("INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)",
+                         (SCHEMA_VERSION_KEY, str(version)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
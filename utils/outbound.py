@@ -0,0 +1,214 @@
+# utils/outbound.py
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+
+from config_loader import OUTBOUND, WORKERS
+
+# Очереди приоритета: ответы на действия пользователя уходят раньше фоновых уведомлений
+INTERACTIVE = 0
+BACKGROUND = 1
+LANE_NAMES = ("interactive", "background")
+
+# Очередь, в которую попадают запросы текущей задачи; по умолчанию - интерактивная
+lane = contextvars.ContextVar("outbound_lane", default=INTERACTIVE)
+
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+UNLIMITED_METHODS = {"sendChatAction"}
+
+
+@contextlib.contextmanager
+def background():
+    """Отправлять сообщения внутри блока через очередь фоновых уведомлений."""
+    token = lane.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        lane.reset(token)
+
+
+class OutboundScheduler:
+    """
+    Планировщик исходящих сообщений: не больше rate сообщений в секунду на бота
+    и per_chat_rate в секунду в один чат (с запасом per_chat_burst подряд).
+    Запросы ждут очереди по приоритету; чат, получивший 429, ставится на паузу на retry_after секунд.
+    """
+
+    def __init__(self, rate: float = 30, per_chat_rate: float = 1, per_chat_burst: float = 3,
+                 max_retries: int = 3, max_chats: int = 10000):
+        self.rate = rate
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+
+        self._queues = tuple(deque() for _ in LANE_NAMES)
+        self._tokens = rate
+        self._updated_at = time.monotonic()
+        # {chat_id: [токены, время обновления, пауза до]}
+        self._chats: dict = {}
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+
+        self.sent = 0
+        self.retried = 0
+        self.max_depth = 0
+
+    # --- Лимиты ---
+
+    def _refill(self, now: float):
+        self._tokens = min(self.rate, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _chat_wait(self, chat_id, now: float) -> float:
+        """Сколько секунд чат ещё не может получать сообщения."""
+        state = self._chats.get(chat_id)
+        if state is None:
+            return 0
+        tokens, updated_at, paused_until = state
+        if paused_until > now:
+            return paused_until - now
+        tokens = min(self.per_chat_burst, tokens + (now - updated_at) * self.per_chat_rate)
+        return 0 if tokens >= 1 else (1 - tokens) / self.per_chat_rate
+
+    def _take(self, chat_id, now: float):
+        self._tokens -= 1
+        self.sent += 1
+        if chat_id is None:
+            return
+        tokens, updated_at, paused_until = self._chats.get(chat_id) or (self.per_chat_burst, now, 0)
+        tokens = min(self.per_chat_burst, tokens + (now - updated_at) * self.per_chat_rate)
+        self._chats[chat_id] = [tokens - 1, now, paused_until]
+        if len(self._chats) > self.max_chats:
+            self._forget_idle(now)
+
+    def _forget_idle(self, now: float):
+        """Забывает чаты, лимит которых полностью восстановился."""
+        for chat_id, (tokens, updated_at, paused_until) in list(self._chats.items()):
+            if paused_until <= now and tokens + (now - updated_at) * self.per_chat_rate >= self.per_chat_burst:
+                del self._chats[chat_id]
+
+    def pause(self, chat_id, seconds: float):
+        """Telegram ответил 429: в этот чат ничего не отправляем seconds секунд (без чата - никуда)."""
+        self.retried += 1
+        now = time.monotonic()
+        if chat_id is None:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+            return
+        paused_until = max(now + seconds, self._chats.get(chat_id, (0, 0, 0))[2])
+        # После паузы - одно сообщение сразу, дальше с обычной скоростью
+        self._chats[chat_id] = [1, paused_until, paused_until]
+
+    # --- Очередь ---
+
+    async def acquire(self, chat_id=None):
+        """Ждёт, пока можно отправить сообщение в chat_id."""
+        now = time.monotonic()
+        # Быстрый путь: очередь пуста и лимиты не исчерпаны
+        if not any(self._queues):
+            self._refill(now)
+            if self._tokens >= 1 and self._chat_wait(chat_id, now) == 0:
+                self._take(chat_id, now)
+                return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[lane.get()].append((chat_id, future))
+        self.max_depth = max(self.max_depth, sum(len(queue) for queue in self._queues))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        # Если задачу отменят, future отменится вместе с ней и диспетчер её пропустит
+        await future
+
+    def _grant_next(self, now: float) -> float:
+        """Пропускает первый запрос, чей чат свободен. Возвращает 0 или время до освобождения ближайшего чата."""
+        nearest = None
+        for queue in self._queues:
+            while queue and queue[0][1].done():
+                queue.popleft()
+            for position, (chat_id, future) in enumerate(queue):
+                if future.done():
+                    continue
+                wait = self._chat_wait(chat_id, now)
+                if wait == 0:
+                    del queue[position]
+                    self._take(chat_id, now)
+                    future.set_result(None)
+                    return 0
+                nearest = wait if nearest is None else min(nearest, wait)
+        if nearest is None:
+            # Остались только отменённые запросы
+            for queue in self._queues:
+                queue.clear()
+            return 0
+        return nearest
+
+    async def _dispatch(self):
+        while any(self._queues):
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            delay = self._grant_next(now)
+            if delay > 0:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+
+    def stats(self) -> dict:
+        """Глубина очередей и счётчики этого процесса для экрана нагрузки в админ-панели."""
+        depth = {name: sum(1 for _, future in queue if not future.done())
+                 for name, queue in zip(LANE_NAMES, self._queues)}
+        return {**depth, "sent": self.sent, "retried": self.retried, "max_depth": self.max_depth}
+
+
+class OutboundSession(AiohttpSession):
+    """Сессия aiogram, пропускающая отправку сообщений через планировщик и повторяющая запросы после 429."""
+
+    def __init__(self, scheduler: OutboundScheduler, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+
+    async def make_request(self, bot: Bot, method, timeout=None):
+        api_method = method.__api_method__
+        limited = api_method.startswith(LIMITED_PREFIXES) and api_method not in UNLIMITED_METHODS
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            if limited:
+                await self.scheduler.acquire(chat_id)
+            try:
+                return await super().make_request(bot, method, timeout)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.scheduler.max_retries:
+                    raise
+                logging.warning(f"Telegram: {api_method} в чат {chat_id} - превышен лимит, повтор через {e.retry_after} с")
+                if limited:
+                    self.scheduler.pause(chat_id, e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
+
+
+def _scheduler_settings() -> dict:
+    settings = dict(OUTBOUND)
+    # В режиме нескольких воркеров каждый процесс отправляет сообщения сам,
+    # поэтому общий лимит бота делится между ними поровну
+    workers = max(WORKERS.get("count", 1), 1)
+    settings["rate"] = settings.get("rate", 30) / workers
+    return settings
+
+
+# Единый планировщик процесса, через который отправляет сообщения бот
+outbound_scheduler = OutboundScheduler(**_scheduler_settings())
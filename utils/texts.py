@@ -1,17 +1,102 @@
 # utils/texts.py
+import ast
 import json
+import logging
+import os
+import re
+import string
+import time
+
+# Как часто (в секундах) проверять, не изменился ли файл с текстами
+RELOAD_CHECK_INTERVAL = 2
+
+_formatter = string.Formatter()
+
+
+def _flatten(data: dict, prefix: str = "") -> dict:
+    """{"a": {"b": "x"}} -> {"a.b": "x"}"""
+    flat = {}
+    for key, value in data.items():
+        full_key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, full_key + "."))
+        else:
+            flat[full_key] = value
+    return flat
+
+def _placeholders(template: str) -> set[str]:
+    """Имена аргументов, которые нужны шаблону: "{name}", "{user.id}" и "{items[0]}" дают name, user и items."""
+    names = set()
+    for _, field, spec, _ in _formatter.parse(template):
+        if field is not None:
+            names.add(re.split(r"[.\[]", field, maxsplit=1)[0])
+        if spec:
+            names |= _placeholders(spec)
+    return names
+
 
 class TextMessages:
+    """
+    Тексты бота из texts.json. При загрузке вложенные ключи разворачиваются в плоскую таблицу
+    "account.title" -> шаблон, и поиск текста - одно обращение к словарю.
+    Файл перечитывается при изменении, так что правки текстов применяются без перезапуска бота.
+    """
+
     def __init__(self, file_path="texts.json"):
+        self.file_path = file_path
+        self.templates: dict[str, str] = {}
+        # Имена аргументов каждого шаблона; шаблоны с ошибкой в синтаксисе сюда не попадают
+        self.placeholders: dict[str, set[str]] = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self.load()
+
+    def load(self) -> bool:
+        """Загружает и компилирует файл. При ошибке остаются прежние тексты."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.data = json.load(f)
+            mtime = os.stat(self.file_path).st_mtime_ns
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
         except FileNotFoundError:
-            print(f"Error: Text file not found at {file_path}")
-            self.data = {}
-        except json.JSONDecodeError:
-            print(f"Error: Could not decode JSON from {file_path}")
-            self.data = {}
+            print(f"Error: Text file not found at {self.file_path}")
+            return False
+        except json.JSONDecodeError as e:
+            print(f"Error: Could not decode JSON from {self.file_path}: {e}")
+            self._mtime = mtime
+            return False
+
+        templates = {key: value for key, value in _flatten(data).items() if isinstance(value, str)}
+        placeholders = {}
+        for key, template in templates.items():
+            try:
+                placeholders[key] = _placeholders(template)
+            except ValueError as e:
+                logging.error(f"Тексты: ошибка в шаблоне {key}: {e}")
+
+        self.templates, self.placeholders = templates, placeholders
+        self._mtime = mtime
+        return True
+
+    def reload_if_changed(self):
+        """Перечитывает файл, если он изменился (не чаще раза в RELOAD_CHECK_INTERVAL секунд)."""
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.file_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime and self.load():
+            logging.info(f"Тексты: {self.file_path} перечитан")
+            self.validate()
+
+    def validate(self) -> bool:
+        """Сверяет шаблоны с местами вызова в коде и пишет найденные проблемы в лог."""
+        problems = check_call_sites(self)
+        for problem in problems:
+            logging.warning(f"Тексты: {problem}")
+        return not problems
 
     def get(self, key: str, **kwargs) -> str:
         """
@@ -19,21 +104,88 @@ class TextMessages:
         Ключи могут быть вложенными, разделенными точкой.
         Пример: texts.get("account.title", user_id=123, balance=100)
         """
-        try:
-            # Навигация по вложенным ключам
-            value = self.data
-            for k in key.split('.'):
-                value = value[k]
-            
-            # Форматирование строки, если переданы аргументы
-            if kwargs:
-                return value.format(**kwargs)
-            return value
-        except KeyError:
+        self.reload_if_changed()
+        template = self.templates.get(key)
+        if template is None:
             # Возвращаем заметное сообщение об ошибке, если ключ не найден
             return f"!!TEXT NOT FOUND: {key}!!"
+        if not kwargs:
+            return template
+        try:
+            return template.format(**kwargs)
         except Exception as e:
+            logging.error(f"Тексты: не удалось подставить аргументы в {key}: {e!r}")
             return f"!!TEXT ERROR: {e}!!"
 
+
+# --- Проверка мест вызова ---
+
+_call_sites: list | None = None
+
+def _find_call_sites(root: str) -> list:
+    """Все вызовы texts.get("...", ...) в коде бота: (файл, строка, ключ или regex ключа, аргументы или None)."""
+    sites = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(('.', '__')) and d not in ("venv", "data")]
+        for filename in filenames:
+            if not filename.endswith(".py"):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    tree = ast.parse(f.read(), path)
+            except (OSError, SyntaxError):
+                continue
+            for node in ast.walk(tree):
+                if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                        and node.func.attr == "get" and isinstance(node.func.value, ast.Name)
+                        and node.func.value.id == "texts" and node.args):
+                    continue
+                key = node.args[0]
+                if isinstance(key, ast.Constant) and isinstance(key.value, str):
+                    key = key.value
+                elif isinstance(key, ast.JoinedStr):
+                    # f"account.history_kinds.{kind}" - проверяются все ключи, подходящие под шаблон
+                    key = re.compile("".join(
+                        re.escape(part.value) if isinstance(part, ast.Constant) else ".+" for part in key.values
+                    ))
+                else:
+                    continue
+                # **kwargs в вызове - набор аргументов заранее неизвестен
+                arguments = None if any(k.arg is None for k in node.keywords) else {k.arg for k in node.keywords}
+                sites.append((os.path.relpath(path, root), node.lineno, key, arguments))
+    return sites
+
+def check_call_sites(messages: TextMessages, root: str | None = None) -> list[str]:
+    """
+    Сверяет тексты с кодом: ключ из вызова существует, а все аргументы шаблона в вызов переданы.
+    Возвращает список найденных проблем.
+    """
+    global _call_sites
+    if _call_sites is None:
+        _call_sites = _find_call_sites(root or os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    problems = []
+    for path, line, key, arguments in _call_sites:
+        if isinstance(key, str):
+            keys = [key] if key in messages.templates else []
+            if not keys:
+                problems.append(f"{path}:{line}: ключ {key} не найден")
+        else:
+            keys = [k for k in messages.templates if key.fullmatch(k)]
+            if not keys:
+                problems.append(f"{path}:{line}: нет ключей, подходящих под {key.pattern}")
+        if arguments is None:
+            continue
+        for matched in keys:
+            missing = messages.placeholders.get(matched, set()) - arguments
+            # Без аргументов шаблон возвращается как есть, без форматирования
+            if missing and arguments:
+                problems.append(f"{path}:{line}: в {matched} не передаются {', '.join(sorted(missing))}")
+            elif missing:
+                problems.append(f"{path}:{line}: {matched} вызывается без аргументов, но ждёт {', '.join(sorted(missing))}")
+    return problems
+
+
 # Создаем единый экземпляр, который будет использоваться во всем боте
-texts = TextMessages()
\ No newline at end of file
+texts = TextMessages()
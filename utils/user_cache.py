@@ -0,0 +1,45 @@
+# utils/user_cache.py
+import time
+from collections import OrderedDict
+
+from config_loader import USER_CACHE
+
+
+class UserCache:
+    """
+    Ограниченный LRU-кэш записей пользователей с временем жизни записи.
+    Снимает с горячего пути (middleware, фильтры) запрос к БД на каждое обновление.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+
+    def get(self, user_id: int) -> dict | None:
+        entry = self._data.get(user_id)
+        if entry is None:
+            return None
+        stored_at, user = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._data[user_id]
+            return None
+        self._data.move_to_end(user_id)
+        # Отдаём копию, чтобы изменения в обработчиках не попадали в кэш
+        return dict(user)
+
+    def set(self, user_id: int, user: dict):
+        self._data[user_id] = (time.monotonic(), dict(user))
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._data.pop(user_id, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+# Единый кэш, который используется во всем боте
+user_cache = UserCache(**USER_CACHE)
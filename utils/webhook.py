@@ -0,0 +1,81 @@
+# utils/webhook.py
+import asyncio
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config_loader import WEBHOOK
+
+ENABLED = WEBHOOK.get("enabled", False)
+HOST = WEBHOOK.get("host", "0.0.0.0")
+PORT = WEBHOOK.get("port", 8080)
+PATH = WEBHOOK.get("path", "/webhook")
+# Публичный адрес, по которому Telegram доступен наш сервер (обычно за nginx с HTTPS)
+BASE_URL = WEBHOOK.get("base_url", "").rstrip("/")
+# Регистрировать ли вебхук в Telegram при запуске; выключается для локальной проверки через curl
+REGISTER = WEBHOOK.get("register", True)
+
+
+def resolve_secret_token() -> str:
+    token = WEBHOOK.get("secret_token", "")
+    if not token:
+        # Без секрета любой мог бы присылать боту поддельные обновления
+        token = secrets.token_urlsafe(32)
+        logging.warning("Вебхук: secret_token не задан в config.py, сгенерирован случайный на время работы")
+    return token
+
+
+def create_app(bot: Bot, dp: Dispatcher, secret_token: str) -> web.Application:
+    """
+    Приложение aiohttp с обработчиком обновлений на PATH.
+    Обновления обрабатываются в фоне: Telegram сразу получает 200, не дожидаясь хэндлеров.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=True,
+    ).register(app, path=PATH)
+    # Запуск и остановка диспетчера (startup/shutdown хуки) вместе с приложением
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def serve(app: web.Application, bot: Bot, allowed_updates: list[str], secret_token: str):
+    """Поднимает HTTP-сервер с app до отмены задачи; регистрирует вебхук при запуске и снимает при остановке."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, HOST, PORT)
+    await site.start()
+    logging.info(f"Вебхук: сервер слушает {HOST}:{PORT}{PATH}")
+
+    registered = False
+    try:
+        if REGISTER:
+            if not BASE_URL:
+                raise RuntimeError("Вебхук: не задан webhook['base_url'] в config.py")
+            await bot.set_webhook(
+                BASE_URL + PATH,
+                secret_token=secret_token,
+                allowed_updates=allowed_updates,
+            )
+            registered = True
+            logging.info(f"Вебхук: зарегистрирован {BASE_URL + PATH}")
+        await asyncio.Event().wait()
+    finally:
+        if registered:
+            try:
+                await bot.delete_webhook()
+            except Exception as e:
+                logging.warning(f"Вебхук: не удалось снять регистрацию: {e}")
+        await runner.cleanup()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Принимает обновления через вебхук до отмены задачи."""
+    secret_token = resolve_secret_token()
+    await serve(create_app(bot, dp, secret_token), bot, dp.resolve_used_update_types(), secret_token)
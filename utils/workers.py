@@ -0,0 +1,228 @@
+# utils/workers.py
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import time
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from config_loader import BOT_TOKEN, WORKERS
+from utils import database as db
+from utils import webhook
+
+COUNT = WORKERS.get("count", 1)
+ENABLED = COUNT > 1
+# Аренда лидерства: лидер продлевает её каждые LEASE_TTL / 3 секунд, после остановки лидера её забирает другой воркер
+LEASE_TTL = WORKERS.get("lease_ttl", 30)
+LEASE_NAME = "background_tasks"
+# Сколько ждать завершения воркеров при остановке, прежде чем завершить их принудительно
+STOP_TIMEOUT = WORKERS.get("stop_timeout", 10)
+POLLING_TIMEOUT = 30
+API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/"
+
+
+def _actor_id(update: dict) -> int:
+    """ID пользователя (или чата), от которого пришло обновление; 0, если его нет."""
+    for event in update.values():
+        if isinstance(event, dict):
+            actor = event.get("from") or event.get("user") or event.get("chat") or {}
+            return actor.get("id", 0)
+    return 0
+
+def route(update: dict) -> int:
+    """Номер воркера для обновления: все обновления одного пользователя попадают в один процесс."""
+    return _actor_id(update) % COUNT
+
+
+# --- Супервизор ---
+
+class Supervisor:
+    """
+    Запускает COUNT процессов-воркеров и раздаёт им обновления через очереди multiprocessing.
+    Сам супервизор не разбирает обновления и не ходит в БД - только получает JSON от Telegram и маршрутизирует.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self._ctx = multiprocessing.get_context("spawn")
+        self.queues = [self._ctx.Queue() for _ in range(COUNT)]
+        self.processes: list = [None] * COUNT
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(target=self.target, args=(index, self.queues[index]), name=f"worker-{index}")
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(COUNT):
+            self._spawn(index)
+        logging.info(f"Запущено процессов-воркеров: {COUNT}")
+
+    def dispatch(self, update: dict):
+        self.queues[route(update)].put(update)
+
+    async def watch(self):
+        """Перезапускает упавшие воркеры; накопившиеся в их очереди обновления не теряются."""
+        while True:
+            await asyncio.sleep(5)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logging.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапускаю")
+                    self._spawn(index)
+
+    async def stop(self):
+        # None в очереди - сигнал воркеру дообработать начатое и завершиться
+        for updates in self.queues:
+            updates.put(None)
+        for index, process in enumerate(self.processes):
+            await asyncio.to_thread(process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logging.warning(f"Воркер {index} не завершился за {STOP_TIMEOUT} с, останавливаю принудительно")
+                process.terminate()
+
+
+async def _poll(supervisor: Supervisor, allowed_updates: list[str]):
+    """
+    Long polling без aiogram: getUpdates запрашивается напрямую, и обновления уходят воркерам
+    в виде словарей - разбор в объекты aiogram происходит уже в процессах-воркерах.
+    """
+    params = {"timeout": POLLING_TIMEOUT, "allowed_updates": allowed_updates}
+    request_timeout = aiohttp.ClientTimeout(total=POLLING_TIMEOUT + 10)
+    async with aiohttp.ClientSession(timeout=request_timeout) as session:
+        while True:
+            try:
+                async with session.post(API_URL + "getUpdates", json=params) as response:
+                    result = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.warning(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            if not result.get("ok"):
+                logging.error(f"Telegram отклонил getUpdates: {result.get('description')}")
+                await asyncio.sleep(result.get("parameters", {}).get("retry_after", 5))
+                continue
+            for update in result["result"]:
+                supervisor.dispatch(update)
+                params["offset"] = update["update_id"] + 1
+
+
+async def _serve_webhook(supervisor: Supervisor, allowed_updates: list[str]):
+    secret_token = webhook.resolve_secret_token()
+
+    async def handle(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return web.Response(status=401)
+        supervisor.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(webhook.PATH, handle)
+    # Bot в супервизоре нужен только для регистрации вебхука
+    bot = Bot(token=BOT_TOKEN)
+    try:
+        await webhook.serve(app, bot, allowed_updates, secret_token)
+    finally:
+        await bot.session.close()
+
+
+async def run_supervisor(target, allowed_updates: list[str]):
+    """Главный процесс режима нескольких воркеров: target(index, queue) - точка входа процесса-воркера."""
+    supervisor = Supervisor(target)
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+    try:
+        if webhook.ENABLED:
+            await _serve_webhook(supervisor, allowed_updates)
+        else:
+            await _poll(supervisor, allowed_updates)
+    finally:
+        watcher.cancel()
+        await supervisor.stop()
+
+
+# --- Процесс-воркер ---
+
+async def _lead(bot: Bot, start_tasks, stop_tasks):
+    """Борется за аренду лидерства; фоновые задачи работают, только пока аренда за этим процессом."""
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    tasks = None
+    renewed_at = 0.0
+    try:
+        while True:
+            try:
+                leading = await db.acquire_lease(LEASE_NAME, holder, LEASE_TTL)
+                renewed_at = time.monotonic()
+            except Exception as e:
+                logging.error(f"Не удалось продлить аренду лидерства: {e}")
+                # Уступаем заранее, до истечения аренды, чтобы два лидера не работали одновременно
+                leading = tasks is not None and time.monotonic() - renewed_at < LEASE_TTL * 2 / 3
+
+            if leading and tasks is None:
+                logging.info("Процесс стал лидером и запускает фоновые задачи")
+                tasks = await start_tasks(bot)
+            elif not leading and tasks is not None:
+                logging.warning("Процесс потерял лидерство, фоновые задачи остановлены")
+                await stop_tasks(tasks)
+                tasks = None
+            await asyncio.sleep(LEASE_TTL / 3)
+    finally:
+        if tasks is not None:
+            await stop_tasks(tasks)
+            with contextlib.suppress(Exception):
+                await db.release_lease(LEASE_NAME, holder)
+
+
+async def _handle(dp: Dispatcher, bot: Bot, update: dict, previous: asyncio.Task | None):
+    # Обновления одного пользователя обрабатываются строго по очереди
+    if previous is not None:
+        await asyncio.wait([previous])
+    try:
+        await dp.feed_raw_update(bot, update)
+    except Exception:
+        logging.exception(f"Ошибка обработки обновления {update.get('update_id')}")
+
+
+async def run_worker(index: int, updates, bot: Bot, dp: Dispatcher, start_tasks, stop_tasks):
+    """Обрабатывает обновления из очереди updates, пока супервизор не пришлёт None."""
+    # Остановкой воркеров управляет супервизор, Ctrl+C и сигналы pm2 обрабатывает только он
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    parent = os.getppid()
+    loop = asyncio.get_running_loop()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    leader = asyncio.create_task(_lead(bot, start_tasks, stop_tasks))
+    # Последняя задача каждого пользователя: следующее обновление ждёт её завершения
+    pending: dict[int, asyncio.Task] = {}
+    logging.info(f"Воркер {index} запущен")
+    try:
+        while True:
+            try:
+                update = await loop.run_in_executor(None, updates.get, True, 1)
+            except queue.Empty:
+                if os.getppid() != parent:
+                    logging.error("Супервизор завершился, воркер останавливается")
+                    break
+                continue
+            if update is None:
+                break
+
+            actor = _actor_id(update)
+            task = asyncio.create_task(_handle(dp, bot, update, pending.get(actor)))
+            pending[actor] = task
+            task.add_done_callback(lambda t, actor=actor: pending.get(actor) is t and pending.pop(actor))
+
+        if pending:
+            await asyncio.gather(*pending.values())
+    finally:
+        leader.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await leader
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)